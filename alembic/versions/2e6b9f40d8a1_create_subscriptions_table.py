@@ -0,0 +1,46 @@
+"""create_subscriptions_table
+
+Revision ID: 2e6b9f40d8a1
+Revises: c9d84e1a7b35
+Create Date: 2026-10-18 19:11:52.204318
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision: str = '2e6b9f40d8a1'
+down_revision: Union[str, None] = 'c9d84e1a7b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the table of passengers' saved searches."""
+    op.create_table(
+        'subscriptions',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('from_city', sa.String(), nullable=False),
+        sa.Column('to_city', sa.String(), nullable=False),
+        sa.Column('first_date', sa.Date(), nullable=False),
+        sa.Column('last_date', sa.Date(), nullable=False),
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'chat_id', 'from_city', 'to_city', 'first_date', 'last_date', name='uq_subscriptions_search'
+        ),
+    )
+    op.create_index('ix_subscriptions_last_date', 'subscriptions', ['last_date'])
+    op.create_index('ix_subscriptions_created_at', 'subscriptions', ['created_at'])
+
+
+def downgrade() -> None:
+    """Drop the subscriptions table."""
+    op.drop_index('ix_subscriptions_created_at', table_name='subscriptions')
+    op.drop_index('ix_subscriptions_last_date', table_name='subscriptions')
+    op.drop_table('subscriptions')
@@ -0,0 +1,36 @@
+"""create_followups_table
+
+Revision ID: 3a7c0e5f2d19
+Revises: 8d2f4b1c9e07
+Create Date: 2026-10-18 11:02:15.584210
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision: str = '3a7c0e5f2d19'
+down_revision: Union[str, None] = '8d2f4b1c9e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the table of pending driver follow-ups."""
+    op.create_table(
+        'followups',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('trip_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.UniqueConstraint('chat_id', 'trip_id', name='uq_followups_chat_trip'),
+    )
+
+
+def downgrade() -> None:
+    """Drop the follow-ups table."""
+    op.drop_table('followups')
@@ -0,0 +1,81 @@
+"""partition_trips_by_departure_date
+
+Revision ID: 7f0c2a9d4e13
+Revises: e5a1f3c8b270
+Create Date: 2026-10-18 15:21:48.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = '7f0c2a9d4e13'
+down_revision: Union[str, None] = 'e5a1f3c8b270'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    """Rebuild ``trips`` as a table range-partitioned by month of ``departure_date``.
+
+    The primary key of a partitioned table must contain the partition key, so it
+    becomes ``(id, departure_date)`` and the ``contacts.trip_id`` foreign key is
+    dropped. Monthly partitions cover the existing rows and the next
+    ``MONTHS_AHEAD`` months; ``python -m bot.partitions`` maintains them later.
+    """
+    op.execute('ALTER TABLE contacts DROP CONSTRAINT IF EXISTS contacts_trip_id_fkey')
+    op.execute('ALTER TABLE trips RENAME TO trips_unpartitioned')
+    op.execute('ALTER TABLE trips_unpartitioned RENAME CONSTRAINT trips_pkey TO trips_unpartitioned_pkey')
+    op.execute('DROP INDEX IF EXISTS ix_trips_route_date')
+    op.execute('DROP INDEX IF EXISTS ix_trips_driver_id')
+    op.execute(
+        """
+        CREATE TABLE trips (LIKE trips_unpartitioned INCLUDING DEFAULTS)
+        PARTITION BY RANGE (departure_date)
+        """
+    )
+    op.execute('ALTER TABLE trips ADD CONSTRAINT trips_pkey PRIMARY KEY (id, departure_date)')
+    op.execute('CREATE INDEX ix_trips_route_date ON trips (from_city, to_city, departure_date)')
+    op.execute('CREATE INDEX ix_trips_driver_id ON trips (driver_id)')
+    op.execute('CREATE TABLE trips_default PARTITION OF trips DEFAULT')
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            part_start date := date_trunc('month', LEAST(
+                (SELECT min(departure_date) FROM trips_unpartitioned), current_date));
+            part_last date := date_trunc('month', current_date) + interval '{MONTHS_AHEAD} months';
+        BEGIN
+            WHILE part_start <= part_last LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF trips FOR VALUES FROM (%L) TO (%L)',
+                    'trips_p' || to_char(part_start, 'YYYYMM'), part_start, (part_start + interval '1 month')::date);
+                part_start := (part_start + interval '1 month')::date;
+            END LOOP;
+        END$$;
+        """
+    )
+    op.execute('INSERT INTO trips SELECT * FROM trips_unpartitioned')
+    op.execute('DROP TABLE trips_unpartitioned')
+
+
+def downgrade() -> None:
+    """Copy the rows back into a plain table and restore the foreign key."""
+    op.execute('ALTER TABLE trips RENAME TO trips_partitioned')
+    op.execute('ALTER TABLE trips_partitioned RENAME CONSTRAINT trips_pkey TO trips_partitioned_pkey')
+    op.execute('DROP INDEX IF EXISTS ix_trips_route_date')
+    op.execute('DROP INDEX IF EXISTS ix_trips_driver_id')
+    op.execute('CREATE TABLE trips (LIKE trips_partitioned INCLUDING DEFAULTS)')
+    op.execute('ALTER TABLE trips ADD CONSTRAINT trips_pkey PRIMARY KEY (id)')
+    op.execute('INSERT INTO trips SELECT * FROM trips_partitioned')
+    op.execute('DROP TABLE trips_partitioned')
+    op.execute('CREATE INDEX ix_trips_route_date ON trips (from_city, to_city, departure_date)')
+    op.execute('CREATE INDEX ix_trips_driver_id ON trips (driver_id)')
+    op.execute(
+        """
+        ALTER TABLE contacts ADD CONSTRAINT contacts_trip_id_fkey
+        FOREIGN KEY (trip_id) REFERENCES trips (id)
+        """
+    )
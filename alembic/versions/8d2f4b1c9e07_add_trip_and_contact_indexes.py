@@ -0,0 +1,49 @@
+"""add_trip_and_contact_indexes
+
+Revision ID: 8d2f4b1c9e07
+Revises: 415045283fa0
+Create Date: 2026-10-18 10:12:41.203518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = '8d2f4b1c9e07'
+down_revision: Union[str, None] = '415045283fa0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Index the search, driver listing and contact lookups without blocking writes."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_trips_route_date',
+            'trips',
+            ['from_city', 'to_city', 'departure_date'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_trips_driver_id',
+            'trips',
+            ['driver_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_contacts_trip_id',
+            'contacts',
+            ['trip_id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Drop the indexes."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_contacts_trip_id', table_name='contacts', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_trips_driver_id', table_name='trips', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_trips_route_date', table_name='trips', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,32 @@
+"""create_fsm_states_table
+
+Revision ID: b41e9d7a6c52
+Revises: 3a7c0e5f2d19
+Create Date: 2026-10-18 12:40:03.117924
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = 'b41e9d7a6c52'
+down_revision: Union[str, None] = '3a7c0e5f2d19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the shared FSM state table."""
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('state', sa.String(), nullable=True),
+        sa.Column('data', sa.Text(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Drop the FSM state table."""
+    op.drop_table('fsm_states')
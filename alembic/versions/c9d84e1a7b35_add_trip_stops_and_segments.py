@@ -0,0 +1,54 @@
+"""add_trip_stops_and_segments
+
+Revision ID: c9d84e1a7b35
+Revises: 7f0c2a9d4e13
+Create Date: 2026-10-18 18:02:37.415620
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision: str = 'c9d84e1a7b35'
+down_revision: Union[str, None] = '7f0c2a9d4e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add ordered ``stops`` to trips and index every route segment in ``trip_segments``.
+
+    Existing trips have no stops, so each gets the single segment of its own route.
+    Searches now go through the segment index, so the route index on ``trips``
+    is dropped.
+    """
+    op.add_column('trips', sa.Column('stops', sa.JSON(), nullable=False, server_default=sa.text("'[]'")))
+    op.add_column('trips_archive', sa.Column('stops', sa.JSON(), nullable=False, server_default=sa.text("'[]'")))
+    op.create_table(
+        'trip_segments',
+        sa.Column('trip_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('from_city', sa.String(), nullable=False),
+        sa.Column('to_city', sa.String(), nullable=False),
+        sa.Column('departure_date', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('trip_id', 'from_city', 'to_city'),
+    )
+    op.execute(
+        'INSERT INTO trip_segments (trip_id, from_city, to_city, departure_date) '
+        'SELECT id, from_city, to_city, departure_date FROM trips'
+    )
+    op.create_index(
+        'ix_trip_segments_route_date', 'trip_segments', ['from_city', 'to_city', 'departure_date', 'trip_id']
+    )
+    op.drop_index('ix_trips_route_date', table_name='trips', if_exists=True)
+
+
+def downgrade() -> None:
+    """Restore the route index on trips, then drop the segments and the stops columns."""
+    op.create_index('ix_trips_route_date', 'trips', ['from_city', 'to_city', 'departure_date'])
+    op.drop_index('ix_trip_segments_route_date', table_name='trip_segments')
+    op.drop_table('trip_segments')
+    op.drop_column('trips_archive', 'stops')
+    op.drop_column('trips', 'stops')
@@ -0,0 +1,54 @@
+"""create_archive_tables
+
+Revision ID: e5a1f3c8b270
+Revises: b41e9d7a6c52
+Create Date: 2026-10-18 14:05:27.660831
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision: str = 'e5a1f3c8b270'
+down_revision: Union[str, None] = 'b41e9d7a6c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create archive tables for past trips and their contacts."""
+    op.create_table(
+        'trips_archive',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('driver_id', sa.Integer(), nullable=False),
+        sa.Column('from_city', sa.String(), nullable=False),
+        sa.Column('to_city', sa.String(), nullable=False),
+        sa.Column('departure_date', sa.Date(), nullable=False),
+        sa.Column('time', sa.Time(), nullable=True),
+        sa.Column('seats', sa.Integer(), nullable=False),
+        sa.Column('price', sa.String(), nullable=True),
+        sa.Column('phone', sa.String(), nullable=False),
+        sa.Column('car', sa.String(), nullable=True),
+        sa.Column('photos', sa.JSON(), nullable=False),
+        sa.Column('comment', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        'contacts_archive',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('trip_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('passenger_id', sa.Integer(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_contacts_archive_trip_id', 'contacts_archive', ['trip_id'])
+
+
+def downgrade() -> None:
+    """Drop the archive tables."""
+    op.drop_index('ix_contacts_archive_trip_id', table_name='contacts_archive')
+    op.drop_table('contacts_archive')
+    op.drop_table('trips_archive')
@@ -0,0 +1,100 @@
+"""CPU time and peak allocation per update for message lookups and keyboards.
+
+An "update" here is what a typical wizard step does besides I/O: a few
+``t()`` lookups (one of them falling back to Russian) and one reply keyboard.
+The previous implementation (nested lookups, keyboards rebuilt every time) is
+compared against the compiled catalogs and cached keyboards::
+
+    python -m benchmarks.i18n_keyboards --updates 100000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from bot.handlers import driver, language, passenger
+from bot.i18n import LOCALES, t
+from bot.utils import build_keyboard
+
+CITIES = [
+    'Bishkek', 'Osh', 'Jalal-Abad', 'Karakol', 'Tokmok', 'Naryn', 'Talas',
+    'Batken', 'Balykchy', 'Kara-Balta', 'Uzgen', 'Cholpon-Ata',
+]
+KEYS = ['driver.from_city', 'driver.seats', 'passenger.time', 'missing.key']
+
+
+def legacy_t(lang: str, key: str) -> str:
+    default = LOCALES.get('ru', {})
+    return LOCALES.get(lang, default).get(key, default.get(key, key))
+
+
+def legacy_update(step: int) -> object:
+    lang = 'kg' if step % 2 else 'ru'
+    for key in KEYS:
+        legacy_t(lang, key)
+    kind = step % 4
+    if kind == 0:
+        return build_keyboard([(c, f"city:{c}") for c in CITIES])
+    if kind == 1:
+        return build_keyboard([(str(i), f"seats:{i}") for i in range(1, 6)] + [("5+", "seats:5")])
+    if kind == 2:
+        return build_keyboard([("🌅", "morning"), ("🌇", "afternoon"), ("🌆", "evening"), ("🌃", "night")])
+    return language.main_menu.__wrapped__(lang)
+
+
+def current_update(step: int) -> object:
+    lang = 'kg' if step % 2 else 'ru'
+    for key in KEYS:
+        t(lang, key)
+    kind = step % 4
+    if kind == 0:
+        return driver.city_kb(tuple(CITIES))
+    if kind == 1:
+        return driver.seats_kb()
+    if kind == 2:
+        return passenger.time_kb(lang)
+    return language.main_menu(lang)
+
+
+def measure(update: Callable[[int], object], count: int) -> Dict[str, float]:
+    for step in range(100):
+        update(step)
+    start = time.process_time()
+    for step in range(count):
+        update(step)
+    cpu = time.process_time() - start
+
+    samples = min(count, 2000)
+    tracemalloc.start()
+    peak = 0
+    for step in range(samples):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        update(step)
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {
+        'cpu_us_per_update': round(cpu / count * 1e6, 2),
+        'peak_bytes_per_update': round(peak / samples),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=100_000)
+    args = parser.parse_args()
+    before = measure(legacy_update, args.updates)
+    after = measure(current_update, args.updates)
+    print(json.dumps({
+        'updates': args.updates,
+        'before': before,
+        'after': after,
+        'cpu_speedup': round(before['cpu_us_per_update'] / after['cpu_us_per_update'], 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
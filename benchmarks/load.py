@@ -0,0 +1,242 @@
+"""End-to-end load test that drives the real handlers with simulated users.
+
+Synthetic ``Update`` objects are fed through a dispatcher built by
+``bot.main.build_dispatcher``, so every router and middleware runs as in
+production. A fake Bot session records outgoing API calls instead of talking
+to Telegram. Drivers walk through the whole ``CreateTrip`` wizard, passengers
+through ``SearchRide`` and then ask for a driver's phone::
+
+    python -m benchmarks.load --drivers 2000 --passengers 2000
+    python -m benchmarks.load --db-url sqlite+aiosqlite:///load.db --drivers 500 --passengers 500
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMediaGroup, SendMessage
+from aiogram.methods.base import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, InlineKeyboardMarkup, Message, Update, User
+
+from bot.cache import CachedStorage, TTLCache
+from bot.config import Config
+from bot.fsm import SQLFSMStorage
+from bot.handlers.driver import SKIP
+from bot.main import build_dispatcher
+from bot.storage import MemoryStorage, SQLStorage, Storage
+
+CITIES = ['Bishkek', 'Osh', 'Jalal-Abad', 'Karakol', 'Naryn']
+LANG = Config.default_language
+
+
+class FakeSession(BaseSession):
+    """Bot session that answers every API call locally and records it."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: Counter[str] = Counter()
+        self.markups: Dict[int, InlineKeyboardMarkup] = {}
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        markup = getattr(method, 'reply_markup', None)
+        chat_id = getattr(method, 'chat_id', None)
+        if isinstance(markup, InlineKeyboardMarkup) and chat_id is not None:
+            self.markups[chat_id] = markup
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id, type='private'),
+                text=method.text,
+            )
+        if isinstance(method, SendMediaGroup):
+            return []
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        yield b''
+
+
+class CountingStorage:
+    """Storage proxy that counts calls per method."""
+
+    def __init__(self, storage: Any) -> None:
+        self._storage = storage
+        self.calls: Counter[str] = Counter()
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._storage, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def counted(*args: Any, **kwargs: Any) -> Any:
+            self.calls[name] += 1
+            return await attr(*args, **kwargs)
+        return counted
+
+
+class Simulation:
+    def __init__(self, dp, bot: Bot, session: FakeSession, rng: random.Random) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.rng = rng
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.updates = 0
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+
+    def _message(self, user_id: int, text: str) -> Message:
+        return Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type='private'),
+            from_user=User(id=user_id, is_bot=False, first_name='load'),
+            text=text,
+        )
+
+    async def _feed(self, step: str, update: Update) -> None:
+        start = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies[step].append((time.perf_counter() - start) * 1000)
+        self.updates += 1
+
+    async def send(self, step: str, user_id: int, text: str) -> None:
+        await self._feed(step, Update(update_id=next(self._update_ids), message=self._message(user_id, text)))
+
+    async def press(self, step: str, user_id: int, data: str) -> None:
+        query = CallbackQuery(
+            id=str(next(self._update_ids)),
+            from_user=User(id=user_id, is_bot=False, first_name='load'),
+            chat_instance=str(user_id),
+            data=data,
+            message=self._message(user_id, '...'),
+        )
+        await self._feed(step, Update(update_id=next(self._update_ids), callback_query=query))
+
+    async def driver(self, user_id: int) -> None:
+        from_city, to_city = self.rng.sample(CITIES, 2)
+        await self.send('driver.start', user_id, '🚗')
+        await self.press('driver.from_city', user_id, f'city:{from_city}')
+        await self.press('driver.to_city', user_id, f'city:{to_city}')
+        if self.rng.random() < 0.3:
+            stop = self.rng.choice([c for c in CITIES if c not in (from_city, to_city)])
+            await self.press('driver.stop', user_id, f'stop:{stop}')
+        await self.press('driver.stops', user_id, 'stops:done')
+        await self.press('driver.date', user_id, f'date:{self.rng.choice((0, 1))}')
+        await self.send('driver.time', user_id, f'{self.rng.randrange(6, 22):02d}:00')
+        await self.press('driver.seats', user_id, f'seats:{self.rng.randint(1, 5)}')
+        await self.press('driver.price', user_id, 'price:none')
+        await self.send('driver.car', user_id, SKIP[LANG])
+        await self.send('driver.photos', user_id, SKIP[LANG])
+        await self.send('driver.phone', user_id, f'+996555{user_id % 1_000_000:06d}')
+        await self.send('driver.comment', user_id, SKIP[LANG])
+        await self.press('driver.confirm', user_id, 'confirm:yes')
+
+    async def passenger(self, user_id: int) -> None:
+        from_city, to_city = self.rng.sample(CITIES, 2)
+        await self.send('passenger.start', user_id, '🔎')
+        await self.press('passenger.from_city', user_id, f'scity:{from_city}')
+        await self.press('passenger.to_city', user_id, f'scity:{to_city}')
+        await self.press('passenger.date', user_id, f'd:{self.rng.choice((0, 1))}')
+        await self.press('passenger.results', user_id, 'morning')
+        markup = self.session.markups.pop(user_id, None)
+        phones = [b.callback_data for row in markup.inline_keyboard for b in row
+                  if b.callback_data.startswith('phone:')] if markup else []
+        if phones:
+            await self.press('passenger.phone', user_id, self.rng.choice(phones))
+
+
+def summary(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+
+    def pct(p: float) -> float:
+        return round(values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))], 3)
+    return {'count': len(values), 'p50_ms': pct(50), 'p95_ms': pct(95), 'p99_ms': pct(99),
+            'mean_ms': round(statistics.fmean(values), 3)}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    config = Config(token='42:load-test', cities=CITIES)
+    if not args.telegram_limits:
+        config.outbox_rate = config.outbox_chat_rate = 1e9
+        config.outbox_chat_burst = 10 ** 9
+    session = FakeSession()
+    bot = Bot(token=config.token, session=session)
+    fsm_storage = None
+    if args.db_url:
+        backend: Storage = await SQLStorage.create(args.db_url)
+        fsm_storage = SQLFSMStorage(backend.session_maker)
+    else:
+        backend = MemoryStorage()
+    counted_backend = CountingStorage(backend)
+    storage = CountingStorage(
+        CachedStorage(counted_backend, TTLCache(config.language_cache_size, config.language_cache_ttl))
+    )
+    dp = build_dispatcher(config, bot, storage, fsm_storage)
+    await dp.emit_startup(bot=bot)
+
+    rng = random.Random(args.seed)
+    sim = Simulation(dp, bot, session, rng)
+    # Drivers queue up first so the earliest passengers already have trips to find.
+    users = [('driver', 10_000_000 + i) for i in range(args.drivers)]
+    users += [('passenger', 20_000_000 + i) for i in range(args.passengers)]
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def user(role: str, user_id: int) -> None:
+        async with limit:
+            await (sim.driver(user_id) if role == 'driver' else sim.passenger(user_id))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(role, uid) for role, uid in users))
+    elapsed = time.perf_counter() - start
+    await dp.emit_shutdown(bot=bot)
+
+    updates = sim.updates
+    return {
+        'drivers': args.drivers,
+        'passengers': args.passengers,
+        'concurrency': args.concurrency,
+        'backend': args.db_url or 'memory',
+        'updates': updates,
+        'seconds': round(elapsed, 3),
+        'updates_per_s': round(updates / elapsed, 1),
+        'storage_calls_per_update': round(sum(storage.calls.values()) / updates, 3),
+        'backend_calls_per_update': round(sum(counted_backend.calls.values()) / updates, 3),
+        'api_calls_per_update': round(sum(session.calls.values()) / updates, 3),
+        'storage_calls': dict(storage.calls),
+        'backend_calls': dict(counted_backend.calls),
+        'api_calls': dict(session.calls),
+        'steps': {step: summary(values) for step, values in sorted(sim.latencies.items())},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drivers', type=int, default=1000)
+    parser.add_argument('--passengers', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=1000, help='users active at the same time')
+    parser.add_argument('--db-url', default='', help='SQLStorage URL; the in-memory backend is used if empty')
+    parser.add_argument('--telegram-limits', action='store_true', help='keep the outbox rate limits')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Bytes per trip held in memory, measured with tracemalloc.
+
+Builds trips the way the SQL backend does (every row brings its own strings,
+dates and photo list) and compares the slotted, interned ``Trip`` against the
+previous plain dataclass layout::
+
+    python -m benchmarks.trip_memory --sizes 100000,1000000
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from bot.storage import Trip
+
+CITIES = ['Bishkek', 'Osh', 'Jalal-Abad', 'Karakol', 'Tokmok', 'Naryn', 'Talas', 'Batken']
+
+
+@dataclass
+class LegacyTrip:
+    id: uuid.UUID
+    driver_id: int
+    from_city: str
+    to_city: str
+    departure_date: date
+    time: Optional[time]
+    seats: int
+    price: Optional[str]
+    phone: str
+    car: Optional[str]
+    photos: List[str]
+    comment: Optional[str]
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+
+def rows(count: int, seed: int):
+    rng = random.Random(seed)
+    today = date.today()
+    for i in range(count):
+        from_city, to_city = rng.sample(CITIES, 2)
+        photos = [f'AgACAgIAAxkBAAI{i:08d}{n}' for n in range(rng.choice((0, 0, 1, 3)))]
+        # Copies mimic values decoded from separate result rows.
+        yield (
+            uuid.uuid4(),
+            rng.randrange(1_000_000_000),
+            ''.join(from_city),
+            (to_city + ' ')[:-1],
+            today + timedelta(days=rng.randrange(14)),
+            time(rng.randrange(24), rng.choice((0, 30))) if rng.random() < 0.8 else None,
+            rng.randint(1, 5),
+            None,
+            f'+996555{i % 1_000_000:06d}',
+            None,
+            photos,
+            None,
+            datetime.utcnow(),
+        )
+
+
+def bytes_per_trip(cls, count: int, seed: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    trips = [cls(*row) for row in rows(count, seed)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del trips
+    gc.collect()
+    return current / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    report = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        legacy = bytes_per_trip(LegacyTrip, size, args.seed)
+        compact = bytes_per_trip(Trip, size, args.seed)
+        report.append({
+            'trips': size,
+            'legacy_bytes_per_trip': round(legacy),
+            'compact_bytes_per_trip': round(compact),
+            'saved_pct': round(100 * (1 - compact / legacy), 1),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
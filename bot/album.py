@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Inner message middleware that hands an album to the handler in one call.
+
+    Telegram delivers every item of an album (messages sharing a
+    ``media_group_id``) as a separate update. The first item waits ``latency``
+    seconds for the rest, which are absorbed here, and then reaches the handler
+    once with all of them in ``data['album']``, ordered by ``message_id``.
+    Messages outside an album pass through untouched.
+    """
+
+    def __init__(self, latency: float = 0.5) -> None:
+        self.latency = latency
+        self._albums: Dict[Tuple[int, str], List[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or event.media_group_id is None:
+            return await handler(event, data)
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(event)
+            return None
+        self._albums[key] = album = [event]
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            del self._albums[key]
+        data['album'] = sorted(album, key=lambda message: message.message_id)
+        return await handler(event, data)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Set, Tuple, TypeVar
+
+from .storage import Storage
+
+V = TypeVar('V')
+
+_MISSING: Any = object()
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after they are written."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+class CachedStorage:
+    """Storage proxy with a read-through, write-through cache for user languages.
+
+    Every other attribute is delegated to the wrapped storage unchanged.
+    """
+
+    def __init__(self, storage: Storage, cache: TTLCache[Optional[str]]) -> None:
+        self._storage = storage
+        self.language_cache = cache
+        # Cache misses being read per user, and users written while such a read was in flight.
+        self._reading: Dict[int, int] = {}
+        self._overwritten: Set[int] = set()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._storage, name)
+
+    async def get_language(self, user_id: int, default: Optional[str] = 'ru') -> Optional[str]:
+        # Unknown users are cached as ``None`` so /start does not hit the DB until they pick a language.
+        language = self.language_cache.get(user_id, _MISSING)
+        if language is _MISSING:
+            self._reading[user_id] = self._reading.get(user_id, 0) + 1
+            try:
+                language = await self._storage.get_language(user_id, None)
+            finally:
+                # A set_language that finished meanwhile already cached the newer value.
+                overwritten = user_id in self._overwritten
+                self._reading[user_id] -= 1
+                if not self._reading[user_id]:
+                    # Cleared here so a failed read does not leave the mark behind.
+                    del self._reading[user_id]
+                    self._overwritten.discard(user_id)
+            if not overwritten:
+                self.language_cache.set(user_id, language)
+        return language if language is not None else default
+
+    async def set_language(self, user_id: int, language: str) -> None:
+        await self._storage.set_language(user_id, language)
+        self.language_cache.set(user_id, language)
+        if user_id in self._reading:
+            self._overwritten.add(user_id)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, Optional, Tuple
+from uuid import UUID
+
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+async def _wait(event: asyncio.Event, timeout: float) -> None:
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+class ContactBuffer:
+    """Write-behind buffer for contact events.
+
+    ``record`` only appends to memory; a background task writes the events with
+    :meth:`Storage.record_contacts` every ``interval`` seconds, or as soon as
+    ``batch_size`` of them are waiting, whichever comes first. At most
+    ``capacity`` events are held: once full, ``record`` waits until a flush
+    makes room, so a slow database slows the taps down instead of growing the
+    buffer.
+
+    A batch leaves the buffer only once it is written. A failed write is
+    retried with exponential backoff from ``retry_delay`` up to
+    ``max_retry_delay`` for as long as the bot runs; ``stop`` writes whatever
+    is left and gives up only after ``shutdown_attempts`` failed tries. It is
+    a dispatcher shutdown hook, so it runs on SIGTERM in polling and webhook
+    mode alike.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        batch_size: int = 100,
+        interval: float = 0.5,
+        capacity: int = 10000,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 30,
+        shutdown_attempts: int = 3,
+    ) -> None:
+        self._storage = storage
+        self._batch_size = batch_size
+        self._interval = interval
+        self._capacity = capacity
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._shutdown_attempts = shutdown_attempts
+        self._events: Deque[Tuple[UUID, int]] = deque()
+        self._full = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._stop_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushed = 0
+        self.failed_writes = 0
+        self.lost = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'buffered': len(self._events),
+            'flushed': self.flushed,
+            'failed_writes': self.failed_writes,
+            'lost': self.lost,
+        }
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Not cancelled: a batch being written when shutdown starts must not be lost.
+            self._stopping = True
+            self._stop_requested.set()
+            self._full.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+            self._stop_requested.clear()
+        for attempt in range(self._shutdown_attempts):
+            if await self._flush():
+                return
+            if attempt + 1 < self._shutdown_attempts:
+                await asyncio.sleep(self._backoff(attempt + 1))
+        self.lost += len(self._events)
+        logger.error('Gave up on %d buffered contacts after %d attempts', len(self._events), self._shutdown_attempts)
+        self._events.clear()
+        self._drained.set()
+
+    async def record(self, trip_id: UUID, passenger_id: int) -> None:
+        while len(self._events) >= self._capacity:
+            self._drained.clear()
+            await self._drained.wait()
+        self._events.append((trip_id, passenger_id))
+        if len(self._events) >= self._batch_size:
+            self._full.set()
+
+    def _backoff(self, failures: int) -> float:
+        return min(self._retry_delay * 2 ** (failures - 1), self._max_retry_delay)
+
+    async def _flush(self) -> bool:
+        """Write everything buffered; False if a write failed and its batch is still at the head."""
+        while self._events:
+            # Peeked rather than popped, so a failed batch keeps its place and counts toward capacity.
+            batch = list(islice(self._events, self._batch_size))
+            try:
+                await self._storage.record_contacts(batch)
+            except Exception:
+                self.failed_writes += 1
+                logger.exception('Failed to write %d contacts, %d buffered', len(batch), len(self._events))
+                return False
+            # Only this task removes events and new ones are appended at the tail.
+            for _ in batch:
+                self._events.popleft()
+            self.flushed += len(batch)
+            self._drained.set()
+        return True
+
+    async def _run(self) -> None:
+        failures = 0
+        while not self._stopping:
+            if failures:
+                await _wait(self._stop_requested, self._backoff(failures))
+            else:
+                await _wait(self._full, self._interval)
+                self._full.clear()
+            if self._stopping:
+                break
+            failures = 0 if await self._flush() else failures + 1
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import copy
+import json
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Mapping, Optional
+from uuid import UUID
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .storage import FSMStateModel
+
+# Wizard data holds dates and times, which plain JSON cannot represent.
+_TYPES = {'datetime': datetime, 'date': date, 'time': time, 'uuid': UUID}
+
+
+def _encode(value: Any) -> Dict[str, str]:
+    for name, cls in _TYPES.items():
+        if isinstance(value, cls):
+            return {'__type__': name, 'value': str(value) if cls is UUID else value.isoformat()}
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    cls = _TYPES.get(obj.get('__type__'))
+    if cls is None or len(obj) != 2:
+        return obj
+    return UUID(obj['value']) if cls is UUID else cls.fromisoformat(obj['value'])
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'dirty')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]) -> None:
+        self.state = state
+        self.data = data
+        self.dirty = False
+
+
+class SQLFSMStorage(BaseStorage):
+    """aiogram FSM storage in the ``fsm_states`` table of the bot database.
+
+    Inside :meth:`batch` every key is read at most once and all changes are
+    written in a single transaction when the batch ends, so an update that
+    calls ``state.update_data`` several times costs one read and one write.
+    Writes are upserts, which lets several bot processes share the table.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession]) -> None:
+        self._session_maker = session_maker
+        dialect = session_maker.kw['bind'].dialect.name
+        self._insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        self._batch: ContextVar[Optional[Dict[str, _Record]]] = ContextVar('fsm_batch', default=None)
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny)
+        return ':'.join('' if part is None else str(part) for part in parts)
+
+    @asynccontextmanager
+    async def batch(self) -> AsyncIterator[None]:
+        if self._batch.get() is not None:
+            yield
+            return
+        records: Dict[str, _Record] = {}
+        token = self._batch.set(records)
+        try:
+            yield
+        finally:
+            self._batch.reset(token)
+            await self._flush(records)
+
+    async def _record(self, key: StorageKey) -> _Record:
+        records = self._batch.get()
+        name = self._key(key)
+        record = records.get(name)
+        if record is None:
+            async with self._session_maker() as session:
+                obj = await session.get(FSMStateModel, name)
+            record = _Record(obj.state, json.loads(obj.data, object_hook=_decode)) if obj else _Record(None, {})
+            records[name] = record
+        return record
+
+    async def _flush(self, records: Dict[str, _Record]) -> None:
+        dirty = {name: record for name, record in records.items() if record.dirty}
+        if not dirty:
+            return
+        async with self._session_maker() as session:
+            for name, record in dirty.items():
+                if record.state is None and not record.data:
+                    await session.execute(delete(FSMStateModel).where(FSMStateModel.key == name))
+                    continue
+                stmt = self._insert(FSMStateModel).values(
+                    key=name,
+                    state=record.state,
+                    data=json.dumps(record.data, default=_encode),
+                )
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[FSMStateModel.key],
+                    set_={'state': stmt.excluded.state, 'data': stmt.excluded.data},
+                ))
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        async with self.batch():
+            record = await self._record(key)
+            record.state = state.state if isinstance(state, State) else state
+            record.dirty = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with self.batch():
+            return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        async with self.batch():
+            record = await self._record(key)
+            record.data = copy.deepcopy(dict(data))
+            record.dirty = True
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with self.batch():
+            return copy.deepcopy((await self._record(key)).data)
+
+    async def close(self) -> None:
+        pass
+
+
+class FSMBatchMiddleware(BaseMiddleware):
+    """Outer update middleware that runs each update inside :meth:`SQLFSMStorage.batch`."""
+
+    def __init__(self, storage: SQLFSMStorage) -> None:
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.storage.batch():
+            return await handler(event, data)
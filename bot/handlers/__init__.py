@@ -1,6 +1,7 @@
-from . import language, driver, passenger, followup, my_trips
+from . import admin, language, driver, passenger, followup, my_trips
 
 __all__ = [
+    'admin',
     'language',
     'driver',
     'passenger',
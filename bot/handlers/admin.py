@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from datetime import date
+
+from aiogram import Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from ..config import Config
+from ..outbox import Outbox
+from ..stats import TripStats
+from ..utils import route_text
+
+router = Router(name='admin')
+
+
+def is_admin(message: Message, config: Config) -> bool:
+    return message.from_user is not None and message.from_user.id in config.admin_ids
+
+
+@router.message(Command("stats"), is_admin)
+async def show_stats(message: Message, stats: TripStats, outbox: Outbox) -> None:
+    today = date.today()
+    day = stats.day(today)
+    lines = [
+        f"🚗 {stats.active_trips} trips, {stats.active_drivers} drivers",
+        f"📅 {today}: {day.trips} trips, {day.contacts} contacts",
+    ]
+    for (from_city, to_city), route in stats.top_routes(today):
+        lines.append(f"{route_text(from_city, to_city)}: {route.trips} trips, {route.contacts} contacts")
+    outbox.submit(message.answer("\n".join(lines)))
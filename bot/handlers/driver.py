@@ -2,26 +2,32 @@ from __future__ import annotations
 
 import uuid
 from datetime import date, timedelta, time as dt_time
+from functools import lru_cache
+from typing import List, Optional
 
 from aiogram import F, Router
 from aiogram.filters.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
 from ..config import Config
 from ..i18n import t
+from ..outbox import Outbox
 from ..storage import Storage, Trip
-from ..utils import build_keyboard, validate_phone, validate_time
+from ..subscriptions import SubscriptionMatcher
+from ..utils import build_keyboard, route_text, validate_phone, validate_time
 
-router = Router()
+router = Router(name='driver')
 
 SKIP = {"ru": "Пропустить", "kg": "Өткөрүү"}
 AGREE = {"ru": "💬 Договорная", "kg": "💬 Келишимдүү"}
+MAX_PHOTOS = 3
 
 
 class CreateTrip(StatesGroup):
     from_city = State()
     to_city = State()
+    stops = State()
     date = State()
     time = State()
     seats = State()
@@ -33,20 +39,46 @@ class CreateTrip(StatesGroup):
     confirm = State()
 
 
-def city_kb(cfg: Config) -> list[tuple[str, str]]:
-    return [(c, f"city:{c}") for c in cfg.cities]
+# Keyboards never change for a given city list or language, so each is built once and shared.
+@lru_cache(maxsize=None)
+def city_kb(cities: tuple[str, ...]) -> InlineKeyboardMarkup:
+    return build_keyboard((c, f"city:{c}") for c in cities)
 
 
-def seats_kb() -> list[tuple[str, str]]:
-    return [(str(i), f"seats:{i}") for i in range(1, 6)] + [("5+", "seats:5")]  # 5 means 5 or more
+@lru_cache(maxsize=None)
+def stops_kb(cities: tuple[str, ...], lang: str) -> InlineKeyboardMarkup:
+    return build_keyboard([(c, f"stop:{c}") for c in cities] + [(t(lang, "driver.stops_done"), "stops:done")])
+
+
+@lru_cache(maxsize=None)
+def seats_kb() -> InlineKeyboardMarkup:
+    return build_keyboard([(str(i), f"seats:{i}") for i in range(1, 6)] + [("5+", "seats:5")])  # 5 means 5 or more
+
+
+@lru_cache(maxsize=None)
+def date_kb() -> InlineKeyboardMarkup:
+    return build_keyboard([
+        ("Сегодня", "date:0"),
+        ("Завтра", "date:1"),
+        ("Введите дату", "date:manual"),
+    ])
+
+
+@lru_cache(maxsize=None)
+def price_kb(lang: str) -> InlineKeyboardMarkup:
+    return build_keyboard([(AGREE[lang], "price:none")])
+
+
+@lru_cache(maxsize=None)
+def confirm_kb(lang: str) -> InlineKeyboardMarkup:
+    return build_keyboard([(t(lang, 'driver.confirm'), 'confirm:yes')])
 
 
 @router.message(F.text.startswith("🚗"))
-async def start_create(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def start_create(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     await state.set_state(CreateTrip.from_city)
-    kb = build_keyboard(city_kb(config))
-    await message.answer(t(lang, "driver.from_city"), reply_markup=kb)
+    outbox.submit(message.answer(t(lang, "driver.from_city"), reply_markup=city_kb(tuple(config.cities))))
 
 
 @router.callback_query(CreateTrip.from_city, F.data.startswith("city:"))
@@ -54,21 +86,40 @@ async def set_from(callback: CallbackQuery, state: FSMContext, config: Config, s
     lang = await storage.get_language(callback.from_user.id, config.default_language)
     await state.update_data(from_city=callback.data.split(":", 1)[1])
     await state.set_state(CreateTrip.to_city)
-    await callback.message.edit_text(t(lang, "driver.to_city"), reply_markup=build_keyboard(city_kb(config)))
+    await callback.message.edit_text(t(lang, "driver.to_city"), reply_markup=city_kb(tuple(config.cities)))
     await callback.answer()
 
 
 @router.callback_query(CreateTrip.to_city, F.data.startswith("city:"))
 async def set_to(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
     lang = await storage.get_language(callback.from_user.id, config.default_language)
-    await state.update_data(to_city=callback.data.split(":", 1)[1])
+    await state.update_data(to_city=callback.data.split(":", 1)[1], stops=[])
+    await state.set_state(CreateTrip.stops)
+    await callback.message.edit_text(t(lang, "driver.stops"), reply_markup=stops_kb(tuple(config.cities), lang))
+    await callback.answer()
+
+
+@router.callback_query(CreateTrip.stops, F.data.startswith("stop:"))
+async def add_stop(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
+    lang = await storage.get_language(callback.from_user.id, config.default_language)
+    data = await state.get_data()
+    city = callback.data.split(":", 1)[1]
+    stops = data.get('stops', [])
+    if city not in stops and city not in (data['from_city'], data['to_city']):
+        stops = [*stops, city]
+        await state.update_data(stops=stops)
+        await callback.message.edit_text(
+            f"{t(lang, 'driver.stops')}\n{route_text(data['from_city'], data['to_city'], stops)}",
+            reply_markup=stops_kb(tuple(config.cities), lang),
+        )
+    await callback.answer()
+
+
+@router.callback_query(CreateTrip.stops, F.data == "stops:done")
+async def stops_done(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
+    lang = await storage.get_language(callback.from_user.id, config.default_language)
     await state.set_state(CreateTrip.date)
-    buttons = [
-        ("Сегодня", "date:0"),
-        ("Завтра", "date:1"),
-        ("Введите дату", "date:manual"),
-    ]
-    await callback.message.edit_text(t(lang, "driver.date"), reply_markup=build_keyboard(buttons))
+    await callback.message.edit_text(t(lang, "driver.date"), reply_markup=date_kb())
     await callback.answer()
 
 
@@ -89,30 +140,30 @@ async def choose_date(callback: CallbackQuery, state: FSMContext, config: Config
 
 
 @router.message(CreateTrip.date)
-async def manual_date(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def manual_date(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     try:
         chosen = date.fromisoformat(message.text)
     except ValueError:
-        await message.answer(t(lang, "driver.date") + " YYYY-MM-DD")
+        outbox.submit(message.answer(t(lang, "driver.date") + " YYYY-MM-DD"))
         return
     await state.update_data(date=chosen)
     await state.set_state(CreateTrip.time)
-    await message.answer(t(lang, "driver.time"))
+    outbox.submit(message.answer(t(lang, "driver.time")))
 
 
 @router.message(CreateTrip.time)
-async def set_time(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def set_time(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     if message.text == SKIP[lang]:
         await state.update_data(time=None)
     elif validate_time(message.text):
         await state.update_data(time=dt_time.fromisoformat(message.text))
     else:
-        await message.answer(t(lang, "driver.time"))
+        outbox.submit(message.answer(t(lang, "driver.time")))
         return
     await state.set_state(CreateTrip.seats)
-    await message.answer(t(lang, "driver.seats"), reply_markup=build_keyboard(seats_kb()))
+    outbox.submit(message.answer(t(lang, "driver.seats"), reply_markup=seats_kb()))
 
 
 @router.callback_query(CreateTrip.seats, F.data.startswith("seats:"))
@@ -121,8 +172,7 @@ async def set_seats(callback: CallbackQuery, state: FSMContext, config: Config,
     seats = int(callback.data.split(":", 1)[1])
     await state.update_data(seats=seats)
     await state.set_state(CreateTrip.price)
-    kb = build_keyboard([(AGREE[lang], "price:none")])
-    await callback.message.edit_text(t(lang, "driver.price"), reply_markup=kb)
+    await callback.message.edit_text(t(lang, "driver.price"), reply_markup=price_kb(lang))
     await callback.answer()
 
 
@@ -136,70 +186,76 @@ async def price_agree(callback: CallbackQuery, state: FSMContext, config: Config
 
 
 @router.message(CreateTrip.price)
-async def set_price(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def set_price(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     await state.update_data(price=message.text)
     await state.set_state(CreateTrip.car)
-    await message.answer(t(lang, "driver.car"))
+    outbox.submit(message.answer(t(lang, "driver.car")))
 
 
 @router.message(CreateTrip.car)
-async def set_car(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def set_car(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     if message.text == SKIP[lang]:
         await state.update_data(car=None)
     else:
         await state.update_data(car=message.text)
     await state.set_state(CreateTrip.photos)
-    await message.answer(t(lang, "driver.photos"))
+    outbox.submit(message.answer(t(lang, "driver.photos")))
 
 
 @router.message(CreateTrip.photos, F.photo)
-async def collect_photo(message: Message, state: FSMContext, storage: Storage, config: Config) -> None:
+async def collect_photo(
+    message: Message,
+    state: FSMContext,
+    storage: Storage,
+    config: Config,
+    outbox: Outbox,
+    album: Optional[List[Message]] = None,
+) -> None:
+    # An album arrives here once, with all of its photos, so it costs a single state write.
     data = await state.get_data()
-    photos = data.get("photos", [])
-    photos.append(message.photo[-1].file_id)
-    if len(photos) >= 3:
-        await state.update_data(photos=photos)
+    added = [m.photo[-1].file_id for m in album or [message] if m.photo]
+    photos = (data.get("photos", []) + added)[:MAX_PHOTOS]
+    await state.update_data(photos=photos)
+    if len(photos) >= MAX_PHOTOS:
         await state.set_state(CreateTrip.phone)
         lang = await storage.get_language(message.from_user.id, config.default_language)
-        await message.answer(t(lang, "driver.phone"))
-    else:
-        await state.update_data(photos=photos)
+        outbox.submit(message.answer(t(lang, "driver.phone")))
 
 
 @router.message(CreateTrip.photos)
-async def skip_photos(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def skip_photos(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     if message.text == SKIP[lang]:
         await state.update_data(photos=[])
         await state.set_state(CreateTrip.phone)
-        await message.answer(t(lang, "driver.phone"))
+        outbox.submit(message.answer(t(lang, "driver.phone")))
     else:
-        await message.answer(t(lang, "driver.photos"))
+        outbox.submit(message.answer(t(lang, "driver.photos")))
 
 
 @router.message(CreateTrip.phone, F.contact)
-async def phone_contact(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def phone_contact(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     await state.update_data(phone=message.contact.phone_number)
     await state.set_state(CreateTrip.comment)
     lang = await storage.get_language(message.from_user.id, config.default_language)
-    await message.answer(t(lang, "driver.comment"))
+    outbox.submit(message.answer(t(lang, "driver.comment")))
 
 
 @router.message(CreateTrip.phone)
-async def phone_text(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def phone_text(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     if not validate_phone(message.text):
-        await message.answer(t(lang, "driver.phone"))
+        outbox.submit(message.answer(t(lang, "driver.phone")))
         return
     await state.update_data(phone=message.text)
     await state.set_state(CreateTrip.comment)
-    await message.answer(t(lang, "driver.comment"))
+    outbox.submit(message.answer(t(lang, "driver.comment")))
 
 
 @router.message(CreateTrip.comment)
-async def set_comment(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def set_comment(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     if message.text == SKIP[lang]:
         await state.update_data(comment=None)
@@ -207,7 +263,7 @@ async def set_comment(message: Message, state: FSMContext, config: Config, stora
         await state.update_data(comment=message.text)
     await state.set_state(CreateTrip.confirm)
     data = await state.get_data()
-    preview = f"{data['from_city']} ➡️ {data['to_city']}\n{data['date']}"
+    preview = f"{route_text(data['from_city'], data['to_city'], data.get('stops', ()))}\n{data['date']}"
     if data.get('time'):
         preview += f" {data['time'].strftime('%H:%M')}"
     preview += f"\n{data['seats']} seats"
@@ -219,12 +275,13 @@ async def set_comment(message: Message, state: FSMContext, config: Config, stora
         preview += f"\n{data['car']}"
     if data.get('comment'):
         preview += f"\n{data['comment']}"
-    kb = build_keyboard([(t(lang, 'driver.confirm'), 'confirm:yes')])
-    await message.answer(preview, reply_markup=kb)
+    outbox.submit(message.answer(preview, reply_markup=confirm_kb(lang)))
 
 
 @router.callback_query(CreateTrip.confirm, F.data == 'confirm:yes')
-async def confirm(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
+async def confirm(
+    callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage, subscriptions: SubscriptionMatcher
+) -> None:
     data = await state.get_data()
     trip = Trip(
         id=uuid.uuid4(),
@@ -237,10 +294,12 @@ async def confirm(callback: CallbackQuery, state: FSMContext, config: Config, st
         price=data.get('price'),
         phone=data['phone'],
         car=data.get('car'),
-        photos=data.get('photos', []),
+        photos=tuple(data.get('photos', ())),
         comment=data.get('comment'),
+        stops=tuple(data.get('stops', ())),
     )
     await storage.create_trip(trip)
+    subscriptions.match(trip)
     await callback.message.edit_text('✅')
     await callback.answer()
     await state.clear()
@@ -3,33 +3,49 @@ from __future__ import annotations
 import uuid
 
 from aiogram import F, Router
+from aiogram.methods import SendMessage
 from aiogram.types import CallbackQuery
 
 from ..config import Config
+from ..contacts import ContactBuffer
 from ..i18n import t
-from ..storage import Storage
-from ..utils import build_keyboard, schedule_followup
-from aiogram import Bot
+from ..outbox import Outbox, Priority
+from ..scheduler import FollowupScheduler
+from ..storage import Followup, Storage
+from ..utils import build_keyboard
 
-router = Router()
+router = Router(name='followup')
+
+
+async def send_followup(outbox: Outbox, followup: Followup) -> None:
+    lang = followup.language
+    follow_kb = build_keyboard([
+        (t(lang, 'followup.full'), f'full:{followup.trip_id}'),
+        (t(lang, 'followup.not_yet'), f'wait:{followup.trip_id}'),
+        (t(lang, 'followup.delete'), f'del:{followup.trip_id}')
+    ])
+    method = SendMessage(chat_id=followup.chat_id, text=t(lang, 'followup.message'), reply_markup=follow_kb)
+    outbox.submit(method, Priority.BACKGROUND)
 
 
 @router.callback_query(F.data.startswith("phone:"))
-async def show_phone(callback: CallbackQuery, storage: Storage, config: Config, bot: Bot) -> None:
+async def show_phone(
+    callback: CallbackQuery,
+    storage: Storage,
+    config: Config,
+    scheduler: FollowupScheduler,
+    outbox: Outbox,
+    contacts: ContactBuffer,
+) -> None:
     trip_id = callback.data.split(":", 1)[1]
     trip = await storage.get_trip(uuid.UUID(trip_id))
     if not trip:
         await callback.answer("❌")
         return
     lang = await storage.get_language(callback.from_user.id, config.default_language)
-    await callback.message.answer(trip.phone)
-    await storage.record_contact(trip.id, callback.from_user.id)
-    follow_kb = build_keyboard([
-        (t(lang, 'followup.full'), f'full:{trip.id}'),
-        (t(lang, 'followup.not_yet'), f'wait:{trip.id}'),
-        (t(lang, 'followup.delete'), f'del:{trip.id}')
-    ])
-    await schedule_followup(bot, trip.driver_id, t(lang, 'followup.message'), config.followup_delay, follow_kb)
+    outbox.submit(callback.message.answer(trip.phone))
+    await contacts.record(trip.id, callback.from_user.id)
+    await scheduler.schedule(trip.id, trip.driver_id, lang, config.followup_delay)
     await callback.answer()
 
 
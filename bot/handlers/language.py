@@ -1,12 +1,15 @@
+from functools import lru_cache
+
 from aiogram import Router, F
 from aiogram.filters import CommandStart
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 
 from ..config import Config
 from ..i18n import t
+from ..outbox import Outbox
 from ..storage import Storage
 
-router = Router()
+router = Router(name='language')
 
 LANG_BUTTONS = {
     '🇷🇺 Русский': 'ru',
@@ -14,6 +17,7 @@ LANG_BUTTONS = {
 }
 
 
+@lru_cache(maxsize=None)
 def main_menu(lang: str) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -24,22 +28,26 @@ def main_menu(lang: str) -> ReplyKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=None)
+def language_kb() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=b) for b in LANG_BUTTONS]],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+
+
 @router.message(CommandStart())
-async def cmd_start(message: Message, storage: Storage, config: Config) -> None:
+async def cmd_start(message: Message, storage: Storage, config: Config, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, None)
     if not lang:
-        kb = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text=b) for b in LANG_BUTTONS]],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        )
-        await message.answer(t(config.default_language, 'start.choose_language'), reply_markup=kb)
+        outbox.submit(message.answer(t(config.default_language, 'start.choose_language'), reply_markup=language_kb()))
     else:
-        await message.answer(t(lang, 'start.choose_language'), reply_markup=main_menu(lang))
+        outbox.submit(message.answer(t(lang, 'start.choose_language'), reply_markup=main_menu(lang)))
 
 
 @router.message(F.text.in_(LANG_BUTTONS.keys()))
-async def set_lang(message: Message, storage: Storage) -> None:
+async def set_lang(message: Message, storage: Storage, outbox: Outbox) -> None:
     lang = LANG_BUTTONS[message.text]
     await storage.set_language(message.from_user.id, lang)
-    await message.answer(t(lang, 'start.choose_language'), reply_markup=main_menu(lang))
+    outbox.submit(message.answer(t(lang, 'start.choose_language'), reply_markup=main_menu(lang)))
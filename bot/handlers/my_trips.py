@@ -5,22 +5,23 @@ import uuid
 from aiogram import F, Router
 from aiogram.types import CallbackQuery, Message
 
+from ..outbox import Outbox
 from ..storage import Storage
-from ..utils import build_keyboard
+from ..utils import build_keyboard, route_text
 
-router = Router()
+router = Router(name='my_trips')
 
 
 @router.message(F.text.startswith("📋"))
-async def list_trips(message: Message, storage: Storage) -> None:
+async def list_trips(message: Message, storage: Storage, outbox: Outbox) -> None:
     trips = await storage.list_driver_trips(message.from_user.id)
     if not trips:
-        await message.answer("😔")
+        outbox.submit(message.answer("😔"))
         return
     for trip in trips:
-        text = f"{trip.from_city} ➡️ {trip.to_city} {trip.departure_date}"
+        text = f"{route_text(trip.from_city, trip.to_city, trip.stops)} {trip.departure_date}"
         kb = build_keyboard([("🗑", f"del:{trip.id}")])
-        await message.answer(text, reply_markup=kb)
+        outbox.submit(message.answer(text, reply_markup=kb))
 
 
 @router.callback_query(F.data.startswith("del:"))
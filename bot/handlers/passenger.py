@@ -1,18 +1,25 @@
 from __future__ import annotations
 
-from datetime import date, timedelta
+import uuid
+from datetime import date, datetime, timedelta, time as dt_time
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 
 from aiogram import F, Router
 from aiogram.filters.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, Message
+from aiogram.methods import SendMediaGroup, SendMessage, SendPhoto
+from aiogram.methods.base import TelegramMethod
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto, Message
 
 from ..config import Config
 from ..i18n import t
-from ..storage import Storage
-from ..utils import build_keyboard
+from ..outbox import Outbox, Priority
+from ..storage import Storage, Subscription, TimeWindow, Trip, TripCursor, trip_cursor
+from ..subscriptions import SubscriptionMatcher
+from ..utils import build_grid, build_keyboard, route_text
 
-router = Router()
+router = Router(name='passenger')
 
 
 class SearchRide(StatesGroup):
@@ -20,26 +27,74 @@ class SearchRide(StatesGroup):
     to_city = State()
     date = State()
     time_pref = State()
+    results = State()
 
 
-def city_kb(cfg: Config) -> list[tuple[str, str]]:
-    return [(c, f"scity:{c}") for c in cfg.cities]
+@lru_cache(maxsize=None)
+def city_kb(cities: tuple[str, ...]) -> InlineKeyboardMarkup:
+    return build_keyboard((c, f"scity:{c}") for c in cities)
 
 
-def time_kb(lang: str) -> list[tuple[str, str]]:
-    return [
+@lru_cache(maxsize=None)
+def date_kb() -> InlineKeyboardMarkup:
+    return build_keyboard([
+        ("Сегодня", "d:0"),
+        ("Завтра", "d:1"),
+        ("Введите дату", "d:manual"),
+    ])
+
+
+# Callback data is limited to 64 bytes: "rides:n:" plus 8 + 12 + 32 characters of cursor.
+def encode_cursor(cursor: TripCursor) -> str:
+    return cursor[0].strftime('%Y%m%d') + cursor[1].strftime('%H%M%S%f') + cursor[2].hex
+
+
+def decode_cursor(value: str) -> TripCursor:
+    return (
+        datetime.strptime(value[:8], '%Y%m%d').date(),
+        datetime.strptime(value[8:20], '%H%M%S%f').time(),
+        uuid.UUID(hex=value[20:]),
+    )
+
+
+def trip_text(trip: Trip) -> str:
+    text = f"{route_text(trip.from_city, trip.to_city, trip.stops)}\n{trip.departure_date}"
+    if trip.time:
+        text += f" {trip.time.strftime('%H:%M')}"
+    text += f"\n{trip.seats} seats"
+    if trip.price:
+        text += f" — {trip.price}"
+    return text
+
+
+TIME_WINDOWS: dict[str, TimeWindow] = {
+    "morning": (dt_time(5), dt_time(12)),
+    "afternoon": (dt_time(12), dt_time(17)),
+    "evening": (dt_time(17), dt_time(22)),
+    "night": (dt_time(22), dt_time(5)),
+}
+
+
+@lru_cache(maxsize=None)
+def subscribe_kb(lang: str) -> InlineKeyboardMarkup:
+    return build_keyboard([(t(lang, "passenger.subscribe"), "sub:new")])
+
+
+@lru_cache(maxsize=None)
+def time_kb(lang: str) -> InlineKeyboardMarkup:
+    return build_keyboard([
         ("🌅", "morning"),
         ("🌇", "afternoon"),
         ("🌆", "evening"),
         ("🌃", "night"),
-    ]
+    ])
 
 
 @router.message(F.text.startswith("🔎"))
-async def start_search(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def start_search(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     await state.set_state(SearchRide.from_city)
-    await message.answer(t(lang, "passenger.from_city"), reply_markup=build_keyboard(city_kb(config)))
+    outbox.submit(message.answer(t(lang, "passenger.from_city"), reply_markup=city_kb(tuple(config.cities))))
 
 
 @router.callback_query(SearchRide.from_city, F.data.startswith("scity:"))
@@ -47,7 +102,7 @@ async def set_from(callback: CallbackQuery, state: FSMContext, config: Config, s
     lang = await storage.get_language(callback.from_user.id, config.default_language)
     await state.update_data(from_city=callback.data.split(":", 1)[1])
     await state.set_state(SearchRide.to_city)
-    await callback.message.edit_text(t(lang, "passenger.to_city"), reply_markup=build_keyboard(city_kb(config)))
+    await callback.message.edit_text(t(lang, "passenger.to_city"), reply_markup=city_kb(tuple(config.cities)))
     await callback.answer()
 
 
@@ -56,12 +111,7 @@ async def set_to(callback: CallbackQuery, state: FSMContext, config: Config, sto
     lang = await storage.get_language(callback.from_user.id, config.default_language)
     await state.update_data(to_city=callback.data.split(":", 1)[1])
     await state.set_state(SearchRide.date)
-    buttons = [
-        ("Сегодня", "d:0"),
-        ("Завтра", "d:1"),
-        ("Введите дату", "d:manual"),
-    ]
-    await callback.message.edit_text(t(lang, "passenger.date"), reply_markup=build_keyboard(buttons))
+    await callback.message.edit_text(t(lang, "passenger.date"), reply_markup=date_kb())
     await callback.answer()
 
 
@@ -77,40 +127,132 @@ async def choose_date(callback: CallbackQuery, state: FSMContext, config: Config
         days = int(data)
         await state.update_data(date=date.today() + timedelta(days=days), manual_date=False)
         await state.set_state(SearchRide.time_pref)
-        await callback.message.edit_text(t(lang, "passenger.time"), reply_markup=build_keyboard(time_kb(lang)))
+        await callback.message.edit_text(t(lang, "passenger.time"), reply_markup=time_kb(lang))
     await callback.answer()
 
 
 @router.message(SearchRide.date)
-async def manual_date(message: Message, state: FSMContext, config: Config, storage: Storage) -> None:
+async def manual_date(message: Message, state: FSMContext, config: Config, storage: Storage, outbox: Outbox) -> None:
     lang = await storage.get_language(message.from_user.id, config.default_language)
     try:
         chosen = date.fromisoformat(message.text)
     except ValueError:
-        await message.answer(t(lang, "passenger.date") + " YYYY-MM-DD")
+        outbox.submit(message.answer(t(lang, "passenger.date") + " YYYY-MM-DD"))
         return
     await state.update_data(date=chosen)
     await state.set_state(SearchRide.time_pref)
-    await message.answer(t(lang, "passenger.time"), reply_markup=build_keyboard(time_kb(lang)))
+    outbox.submit(message.answer(t(lang, "passenger.time"), reply_markup=time_kb(lang)))
 
 
-@router.callback_query(SearchRide.time_pref)
-async def show_rides(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
+def search_dates(chosen: date, config: Config) -> Tuple[date, date]:
+    flex = timedelta(days=config.search_flex_days)
+    return max(chosen - flex, date.today()), chosen + flex
+
+
+async def render_page(
+    callback: CallbackQuery,
+    state: FSMContext,
+    config: Config,
+    storage: Storage,
+    after: Optional[TripCursor] = None,
+    before: Optional[TripCursor] = None,
+) -> bool:
     data = await state.get_data()
-    trips = await storage.search_trips(data['from_city'], data['to_city'], data['date'])
+    size = config.search_page_size
+    first_date, last_date = search_dates(data['date'], config)
+    # One extra row tells whether there is a page beyond this one.
+    trips = await storage.search_trips(
+        data['from_city'],
+        data['to_city'],
+        first_date,
+        limit=size + 1,
+        after=after,
+        before=before,
+        last_date=last_date,
+        window=TIME_WINDOWS.get(data.get('window')),
+    )
+    if before:
+        has_prev, has_next = len(trips) > size, True
+        trips = trips[-size:]
+    else:
+        has_prev, has_next = after is not None, len(trips) > size
+        trips = trips[:size]
     if not trips:
-        await callback.message.edit_text("😔")
-        await callback.answer()
-        await state.clear()
-        return
-    for trip in trips:
-        text = f"{trip.from_city} ➡️ {trip.to_city}\n{trip.departure_date}"
-        if trip.time:
-            text += f" {trip.time.strftime('%H:%M')}"
-        text += f"\n{trip.seats} seats"
-        if trip.price:
-            text += f" — {trip.price}"
-        kb = build_keyboard([("📞", f"phone:{trip.id}")])
-        await callback.message.answer(text, reply_markup=kb)
+        lang = await storage.get_language(callback.from_user.id, config.default_language)
+        await callback.message.edit_text("😔", reply_markup=subscribe_kb(lang))
+        return False
+    text = "\n\n".join(f"{i}. {trip_text(trip)}" for i, trip in enumerate(trips, 1))
+    nav = []
+    if has_prev:
+        nav.append(("⬅️", f"rides:p:{encode_cursor(trip_cursor(trips[0]))}"))
+    if has_next:
+        nav.append(("➡️", f"rides:n:{encode_cursor(trip_cursor(trips[-1]))}"))
+    kb = build_grid([
+        [(f"📞 {i}", f"phone:{trip.id}") for i, trip in enumerate(trips, 1)],
+        [(f"📷 {i}", f"photos:{trip.id}") for i, trip in enumerate(trips, 1) if trip.photos],
+        nav,
+    ])
+    await callback.message.edit_text(text, reply_markup=kb)
+    return True
+
+
+@router.callback_query(SearchRide.time_pref, F.data.in_(TIME_WINDOWS))
+async def show_rides(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
+    await state.update_data(window=callback.data)
+    await render_page(callback, state, config, storage)
+    # Kept on empty results too, for the subscribe button.
+    await state.set_state(SearchRide.results)
     await callback.answer()
+
+
+@router.callback_query(SearchRide.results, F.data == "sub:new")
+async def subscribe(
+    callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage, subscriptions: SubscriptionMatcher
+) -> None:
+    lang = await storage.get_language(callback.from_user.id, config.default_language)
+    data = await state.get_data()
+    first_date, last_date = search_dates(data['date'], config)
+    await subscriptions.subscribe(Subscription(
+        chat_id=callback.from_user.id,
+        from_city=data['from_city'],
+        to_city=data['to_city'],
+        first_date=first_date,
+        last_date=last_date,
+        language=lang,
+    ))
     await state.clear()
+    await callback.message.edit_text(t(lang, "passenger.subscribed"))
+    await callback.answer()
+
+
+async def send_matches(outbox: Outbox, chat_id: int, lang: str, trips: List[Trip]) -> None:
+    text = "\n\n".join([t(lang, "passenger.matches")] + [f"{i}. {trip_text(trip)}" for i, trip in enumerate(trips, 1)])
+    kb = build_grid([[(f"📞 {i}", f"phone:{trip.id}") for i, trip in enumerate(trips, 1)]])
+    outbox.submit(SendMessage(chat_id=chat_id, text=text, reply_markup=kb), Priority.BACKGROUND)
+
+
+@router.callback_query(SearchRide.results, F.data.startswith("rides:"))
+async def turn_page(callback: CallbackQuery, state: FSMContext, config: Config, storage: Storage) -> None:
+    _, direction, cursor = callback.data.split(":", 2)
+    if direction == "n":
+        await render_page(callback, state, config, storage, after=decode_cursor(cursor))
+    else:
+        await render_page(callback, state, config, storage, before=decode_cursor(cursor))
+    await callback.answer()
+
+
+def photos_method(chat_id: int, photos: Sequence[str]) -> TelegramMethod:
+    # Stored file_ids are resent as is; a media group needs at least two items.
+    if len(photos) == 1:
+        return SendPhoto(chat_id=chat_id, photo=photos[0])
+    return SendMediaGroup(chat_id=chat_id, media=[InputMediaPhoto(media=file_id) for file_id in photos])
+
+
+@router.callback_query(F.data.startswith("photos:"))
+async def show_photos(callback: CallbackQuery, storage: Storage, outbox: Outbox) -> None:
+    trip = await storage.get_trip(uuid.UUID(callback.data.split(":", 1)[1]))
+    if not trip or not trip.photos:
+        await callback.answer("❌")
+        return
+    outbox.submit(photos_method(callback.from_user.id, trip.photos))
+    await callback.answer()
@@ -2,17 +2,27 @@ import json
 from pathlib import Path
 from typing import Dict
 
+LOCALES_DIR = Path(__file__).parent / 'locales'
+FALLBACK = 'ru'
 
-def load_locales(path: str = 'bot/locales') -> Dict[str, Dict[str, str]]:
+
+def load_locales(path: str | Path = LOCALES_DIR) -> Dict[str, Dict[str, str]]:
     data: Dict[str, Dict[str, str]] = {}
     for file in Path(path).glob('*.json'):
         data[file.stem] = json.loads(file.read_text())
     return data
 
 
+def compile_catalogs(locales: Dict[str, Dict[str, str]], fallback: str = FALLBACK) -> Dict[str, Dict[str, str]]:
+    """One flat catalog per language with the fallback's messages merged in."""
+    base = locales.get(fallback, {})
+    return {lang: {**base, **messages} for lang, messages in locales.items()}
+
+
 LOCALES = load_locales()
+CATALOGS = compile_catalogs(LOCALES)
+_FALLBACK_CATALOG = CATALOGS.get(FALLBACK, {})
 
 
 def t(lang: str, key: str) -> str:
-    default = LOCALES.get('ru', {})
-    return LOCALES.get(lang, default).get(key, default.get(key, key))
+    return CATALOGS.get(lang, _FALLBACK_CATALOG).get(key, key)
@@ -1,29 +1,179 @@
 import asyncio
+import signal
+from functools import partial
+from typing import Optional
 from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage as FSMStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from .album import AlbumMiddleware
+from .cache import CachedStorage, TTLCache
 from .config import Config
-from .storage import SQLStorage
-from .handlers import language, driver, passenger, followup, my_trips
+from .contacts import ContactBuffer
+from .fsm import FSMBatchMiddleware, SQLFSMStorage
+from .maintenance import TripReaper
+from .metrics import HandlerMetricsMiddleware, InstrumentedStorage, Metrics, MetricsServer, UpdateMetricsMiddleware
+from .outbox import Outbox
+from .partitions import PartitionMaintainer
+from .scheduler import FollowupScheduler
+from .stats import StatsReconciler, StatsStorage, TripStats
+from .storage import SQLStorage, Storage
+from .subscriptions import SubscriptionMatcher
+from .tracing import QueryTraceMiddleware, TraceHandlerMiddleware, instrument_engine
+from .handlers import admin, language, driver, passenger, followup, my_trips
 
 
-async def main() -> None:
-    config = Config.load('config.json')
-    bot = Bot(token=config.token,
-              default=DefaultBotProperties(parse_mode='HTML'))
-    dp = Dispatcher(storage=FSMStorage())
-
-    storage = await SQLStorage.create(config.db_url)
+def build_dispatcher(
+    config: Config,
+    bot: Bot,
+    storage: Storage,
+    fsm_storage: Optional[BaseStorage] = None,
+    metrics: Optional[Metrics] = None,
+) -> Dispatcher:
+    fsm_storage = fsm_storage or FSMStorage()
+    dp = Dispatcher(storage=fsm_storage, disable_fsm=True)
+    if metrics:
+        dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+        # Inner middlewares of the dispatcher also wrap handlers of the included routers.
+        dp.message.middleware(HandlerMetricsMiddleware(metrics))
+        dp.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+    if config.trace_queries:
+        dp.update.outer_middleware(QueryTraceMiddleware(config.query_budget))
+        dp.message.middleware(TraceHandlerMiddleware())
+        dp.callback_query.middleware(TraceHandlerMiddleware())
+    if isinstance(fsm_storage, SQLFSMStorage):
+        # Registered ahead of the FSM middleware so its state lookup is part of the batch too.
+        dp.update.outer_middleware(FSMBatchMiddleware(fsm_storage))
+    dp.update.outer_middleware(dp.fsm)
+    dp.message.middleware(AlbumMiddleware(config.album_latency))
+    stats = TripStats()
+    # Wrapped here so contacts written by the buffer below are counted too.
+    storage = StatsStorage(storage, stats)
     dp['config'] = config
     dp['storage'] = storage
+    dp['stats'] = stats
 
+    outbox = Outbox(bot, config.outbox_rate, config.outbox_chat_rate, config.outbox_chat_burst)
+    scheduler = FollowupScheduler(storage, partial(followup.send_followup, outbox))
+    subscriptions = SubscriptionMatcher(
+        storage,
+        partial(passenger.send_matches, outbox),
+        config.subscription_batch_size,
+        config.subscription_delay,
+        refresh_interval=config.subscription_refresh_interval,
+    )
+    dp['outbox'] = outbox
+    dp['scheduler'] = scheduler
+    dp['subscriptions'] = subscriptions
+    contacts = ContactBuffer(
+        storage, config.contact_batch_size, config.contact_flush_interval, config.contact_buffer_size
+    )
+    dp['contacts'] = contacts
+    dp.startup.register(outbox.start)
+    dp.startup.register(scheduler.start)
+    dp.startup.register(subscriptions.start)
+    dp.startup.register(contacts.start)
+    # Stop producing follow-ups and notifications before the outbox drains.
+    dp.shutdown.register(contacts.stop)
+    dp.shutdown.register(subscriptions.stop)
+    dp.shutdown.register(scheduler.stop)
+    dp.shutdown.register(outbox.stop)
+    if metrics:
+        metrics.gauge('outbox_queued', 'Requests waiting in the outbox', outbox.__len__)
+        metrics.gauge('followups_scheduled', 'Follow-ups waiting to be sent', scheduler.__len__)
+        metrics.gauge('subscriptions', 'Saved searches in the matching index', subscriptions.__len__)
+        metrics.gauge('contacts', 'Contacts in the write-behind buffer', contacts.stats)
+
+    reaper = TripReaper(storage, config.archive_retention_days, config.archive_batch_size, config.archive_interval)
+    dp.startup.register(reaper.start)
+    dp.shutdown.register(reaper.stop)
+    reconciler = StatsReconciler(storage, stats, config.stats_reconcile_interval)
+    dp.startup.register(reconciler.start)
+    dp.shutdown.register(reconciler.stop)
+    if metrics:
+        metrics.gauge('active', 'Current trips and the drivers who posted them', lambda: {
+            'trips': stats.active_trips,
+            'drivers': stats.active_drivers,
+        })
+
+    dp.include_router(admin.router)
     dp.include_router(language.router)
     dp.include_router(driver.router)
     dp.include_router(passenger.router)
     dp.include_router(followup.router)
     dp.include_router(my_trips.router)
+    return dp
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher, config: Config) -> None:
+    if config.webhook_url:
+        await bot.set_webhook(
+            config.webhook_url.rstrip('/') + config.webhook_path,
+            secret_token=config.webhook_secret or None,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+
+
+async def delete_webhook(bot: Bot, config: Config) -> None:
+    if config.webhook_url and config.webhook_delete_on_shutdown:
+        await bot.delete_webhook()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, config: Config) -> None:
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.webhook_secret or None,
+    ).register(app, path=config.webhook_path)
+    dp.startup.register(set_webhook)
+    dp.shutdown.register(delete_webhook)
+    # Runs the dispatcher startup/shutdown hooks together with the aiohttp app.
+    setup_application(app, dp, bot=bot)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, config.webhook_host, config.webhook_port).start()
+        await stop.wait()
+    finally:
+        # Stops accepting requests, then runs the dispatcher shutdown hooks.
+        await runner.cleanup()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+
+
+async def main() -> None:
+    config = Config.load('config.json')
+    bot = Bot(token=config.token,
+              default=DefaultBotProperties(parse_mode='HTML'))
+    metrics = Metrics()
+    sql_storage = await SQLStorage.create(config.db_url, **config.engine_options())
+    if config.trace_queries:
+        instrument_engine(sql_storage.engine)
+    language_cache = TTLCache(config.language_cache_size, config.language_cache_ttl)
+    storage = CachedStorage(InstrumentedStorage(sql_storage, metrics), language_cache)
+    metrics.gauge('db_pool', 'Database connection pool', sql_storage.pool_stats)
+    metrics.gauge('language_cache', 'User language cache', language_cache.stats)
+    dp = build_dispatcher(config, bot, storage, SQLFSMStorage(sql_storage.session_maker), metrics)
+    if config.metrics_port:
+        metrics_server = MetricsServer(metrics, config.metrics_host, config.metrics_port)
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
+    partitions = PartitionMaintainer(sql_storage.engine, config.trip_partitions_ahead)
+    dp.startup.register(partitions.start)
+    dp.shutdown.register(partitions.stop)
 
-    await dp.start_polling(bot)
+    if config.mode == 'webhook':
+        await run_webhook(dp, bot, config)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == '__main__':
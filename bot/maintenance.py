@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReapReport:
+    trips: int
+    contacts: int
+    batches: int
+    seconds: float
+
+
+class TripReaper:
+    """Background task that moves past trips and their contacts into the archive tables.
+
+    Work is done in transactions of at most ``batch_size`` trips with a short
+    pause in between, so row locks are never held for long.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        retention_days: int = 1,
+        batch_size: int = 1000,
+        interval: float = 3600,
+        pause: float = 0.1,
+    ) -> None:
+        self._storage = storage
+        self._retention_days = retention_days
+        self._batch_size = batch_size
+        self._interval = interval
+        self._pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> ReapReport:
+        cutoff = date.today() - timedelta(days=self._retention_days)
+        report = ReapReport(trips=0, contacts=0, batches=0, seconds=0.0)
+        start = time.perf_counter()
+        while True:
+            trip_ids, contacts = await self._storage.archive_trips(cutoff, self._batch_size)
+            report.trips += len(trip_ids)
+            report.contacts += contacts
+            report.batches += 1
+            if len(trip_ids) < self._batch_size:
+                break
+            await asyncio.sleep(self._pause)
+        report.seconds = time.perf_counter() - start
+        logger.info(
+            'Archived %d trips and %d contacts departing before %s in %d batches, %.3fs',
+            report.trips, report.contacts, cutoff, report.batches, report.seconds,
+        )
+        return report
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception('Archiving past trips failed')
+            await asyncio.sleep(self._interval)
@@ -0,0 +1,238 @@
+"""Latency and error metrics exposed in the Prometheus text format.
+
+Handlers are timed by an inner middleware labelled with router and handler
+name, whole updates by an outer middleware, and storage methods by the
+:class:`InstrumentedStorage` proxy. :class:`MetricsServer` serves everything on
+``GET /metrics``.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+
+from .storage import Storage
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = Tuple[Tuple[str, str], ...]
+GaugeValue = Union[float, Mapping[str, float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _key(labels: Mapping[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_format_labels(k)} {v}' for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # Per label set: counts per bucket (non-cumulative, the last one is +Inf), sum.
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {total[0]}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+
+class Metrics:
+    """Registry of the bot's metrics.
+
+    Values that already live elsewhere (queue lengths, pool and cache stats) are
+    registered with :meth:`gauge` as callbacks and read at scrape time.
+    """
+
+    def __init__(self, prefix: str = 'hitchhiker') -> None:
+        self.prefix = prefix
+        self.update_seconds = Histogram(f'{prefix}_update_seconds', 'Time to process an update')
+        self.update_errors = Counter(f'{prefix}_update_errors_total', 'Updates that raised')
+        self.updates_in_flight = Gauge(f'{prefix}_updates_in_flight', 'Updates being processed')
+        self.handler_seconds = Histogram(f'{prefix}_handler_seconds', 'Time spent in a handler')
+        self.handler_errors = Counter(f'{prefix}_handler_errors_total', 'Handler calls that raised')
+        self.storage_seconds = Histogram(f'{prefix}_storage_seconds', 'Time spent in a storage method')
+        self.storage_errors = Counter(f'{prefix}_storage_errors_total', 'Storage calls that raised')
+        self._metrics: List[Union[Counter, Histogram]] = [
+            self.update_seconds, self.update_errors, self.updates_in_flight,
+            self.handler_seconds, self.handler_errors,
+            self.storage_seconds, self.storage_errors,
+        ]
+        self._gauges: List[Tuple[str, str, Callable[[], GaugeValue]]] = []
+
+    def gauge(self, name: str, help: str, read: Callable[[], GaugeValue]) -> None:
+        """Register a gauge read on every scrape; a mapping is exported with a ``stat`` label."""
+        self._gauges.append((f'{self.prefix}_{name}', help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        for name, help, read in self._gauges:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            value = read()
+            if isinstance(value, Mapping):
+                lines.extend(f'{name}{_format_labels((("stat", k),))} {v}' for k, v in value.items())
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: update latency, errors and in-flight count by update type."""
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        self.metrics.updates_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.update_errors.inc(type=update_type)
+            raise
+        finally:
+            self.metrics.update_seconds.observe(time.perf_counter() - start, type=update_type)
+            self.metrics.updates_in_flight.dec()
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing the handler that matched, labelled by router and handler name."""
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        labels = {
+            'router': data['event_router'].name,
+            'handler': data['handler'].callback.__name__,
+        }
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.handler_errors.inc(**labels)
+            raise
+        finally:
+            self.metrics.handler_seconds.observe(time.perf_counter() - start, **labels)
+
+
+class InstrumentedStorage:
+    """Storage proxy that times every coroutine method and counts its errors."""
+
+    def __init__(self, storage: Storage, metrics: Metrics) -> None:
+        self._storage = storage
+        self._metrics = metrics
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._storage, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            except Exception:
+                self._metrics.storage_errors.inc(method=name)
+                raise
+            finally:
+                self._metrics.storage_seconds.observe(time.perf_counter() - start, method=name)
+
+        # Cached on the instance so later lookups skip __getattr__.
+        setattr(self, name, timed)
+        return timed
+
+
+class MetricsServer:
+    """Serves ``GET /metrics`` on a local port."""
+
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = 9100) -> None:
+        self._metrics = metrics
+        self._host = host
+        self._port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self._metrics.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
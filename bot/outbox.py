@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods.base import TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Earliest moment a token is available."""
+        self._refill(now)
+        at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(at, self.paused_until)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+@dataclass
+class _Job:
+    method: TelegramMethod
+    priority: Priority
+    future: asyncio.Future = field(repr=False)
+    attempts: int = 0
+
+
+class Outbox:
+    """Central queue for outgoing Telegram requests.
+
+    Requests are sent in FIFO order per chat, limited by a global and a per-chat
+    token bucket; among chats that may send right now, interactive replies go
+    before background traffic such as follow-ups. ``retry_after`` from a 429 is
+    honoured by pausing the affected chat and resending the request.
+    """
+
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+    ) -> None:
+        self._bot = bot
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._bucket = TokenBucket(rate, rate)
+        self._chat_buckets: Dict[Hashable, TokenBucket] = {}
+        self._queues: Dict[Hashable, Deque[_Job]] = {}
+        self._in_flight: Set[Hashable] = set()
+        self._ready: List[Tuple[int, int, Hashable]] = []
+        self._waiting: List[Tuple[float, int, Hashable]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._sends: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while (self._queues or self._sends) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task:
+            # wait_for() may swallow the cancellation when the wakeup fires at the
+            # same moment, so the loop also checks the flag.
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._stopping = False
+
+    def submit(self, method: TelegramMethod, priority: Priority = Priority.INTERACTIVE) -> asyncio.Future:
+        """Queue ``method`` and return a future with its result.
+
+        Handlers normally do not await the future; failures are logged here.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_failure)
+        chat_id = getattr(method, 'chat_id', None)
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append(_Job(method, priority, future))
+        if len(queue) == 1 and chat_id not in self._in_flight:
+            self._schedule(chat_id)
+        return future
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.MAX_IDLE_BUCKETS:
+                self._prune_buckets()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        now = time.monotonic()
+        for chat_id in [c for c, b in self._chat_buckets.items() if c not in self._queues and b.idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    def _schedule(self, chat_id: Hashable) -> None:
+        now = time.monotonic()
+        ready_at = self._chat_bucket(chat_id).ready_at(now)
+        if ready_at <= now:
+            heapq.heappush(self._ready, (self._queues[chat_id][0].priority, next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._waiting, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._waiting)
+                self._schedule(chat_id)
+            if not self._ready:
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self._bucket.ready_at(now) - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, chat_id = heapq.heappop(self._ready)
+            job = self._queues[chat_id].popleft()
+            self._bucket.take(now)
+            self._chat_bucket(chat_id).take(now)
+            self._in_flight.add(chat_id)
+            task = asyncio.create_task(self._send(chat_id, job))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, chat_id: Hashable, job: _Job) -> None:
+        queue = self._queues[chat_id]
+        try:
+            result: Any = await self._bot(job.method)
+        except TelegramRetryAfter as e:
+            if job.attempts < self._max_retries:
+                job.attempts += 1
+                queue.appendleft(job)
+                (self._chat_bucket(chat_id) if chat_id is not None else self._bucket).pause(e.retry_after)
+                logger.warning('Flood limit for chat %s, retrying in %ss', chat_id, e.retry_after)
+            else:
+                job.future.set_exception(e)
+        except Exception as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            self._in_flight.discard(chat_id)
+            if queue:
+                self._schedule(chat_id)
+            else:
+                del self._queues[chat_id]
+
+
+def _log_failure(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception():
+        logger.error('Outgoing request failed: %r', future.exception())
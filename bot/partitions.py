@@ -0,0 +1,199 @@
+"""Monthly partitions of the ``trips`` table (Postgres only).
+
+Creates partitions ahead of time so new trips never land in the default
+partition, and detaches (optionally drops) partitions whose month has ended::
+
+    python -m bot.partitions create --months 3
+    python -m bot.partitions detach --before 2026-01-01 --drop
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import re
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r'^trips_p(\d{4})(\d{2})$')
+DEFAULT_PARTITION = 'trips_default'
+# Columns shared by ``trips`` and ``trips_archive``.
+ARCHIVE_COLUMNS = (
+    'id, driver_id, from_city, to_city, departure_date, time, seats, price, phone, car, photos, comment, '
+    'created_at, stops'
+)
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'trips_p{month:%Y%m}'
+
+
+async def is_partitioned(engine: AsyncEngine) -> bool:
+    if engine.dialect.name != 'postgresql':
+        return False
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = 'trips'"
+        ))
+        return result.first() is not None
+
+
+async def list_partitions(engine: AsyncEngine) -> List[str]:
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'trips' ORDER BY c.relname"
+        ))
+        return list(result.scalars())
+
+
+async def create_partitions(engine: AsyncEngine, months: int, today: Optional[date] = None) -> List[str]:
+    """Make sure partitions exist for the current month and ``months`` months after it.
+
+    Each month is created in its own transaction, so one failure does not hold
+    back the others.
+    """
+    existing = set(await list_partitions(engine))
+    created = []
+    for offset in range(months + 1):
+        start = month_start(today or date.today(), offset)
+        name = partition_name(start)
+        if name in existing:
+            continue
+        try:
+            async with engine.begin() as conn:
+                await _create_partition(conn, name, start, month_start(start, 1), DEFAULT_PARTITION in existing)
+        except Exception:
+            logger.exception('Creating partition %s failed', name)
+            continue
+        logger.info('Created partition %s', name)
+        created.append(name)
+    return created
+
+
+async def _create_partition(conn: AsyncConnection, name: str, start: date, end: date, has_default: bool) -> None:
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    in_range = f"departure_date >= '{start.isoformat()}' AND departure_date < '{end.isoformat()}'"
+    moved = has_default and (await conn.execute(text(
+        f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})'
+    ))).scalar()
+    if not moved:
+        await conn.execute(text(f'CREATE TABLE {name} PARTITION OF trips FOR VALUES {bounds}'))
+        return
+    # Trips dated past the last partition sit in the default one, and Postgres refuses a new
+    # partition whose range the default already holds rows of. Those rows move over first.
+    await conn.execute(text(f'ALTER TABLE trips DETACH PARTITION {DEFAULT_PARTITION}'))
+    await conn.execute(text(f'CREATE TABLE {name} PARTITION OF trips FOR VALUES {bounds}'))
+    await conn.execute(text(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}'))
+    await conn.execute(text(f'DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}'))
+    await conn.execute(text(f'ALTER TABLE trips ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT'))
+    logger.info('Moved trips of %s out of %s', name, DEFAULT_PARTITION)
+
+
+async def detach_partitions(engine: AsyncEngine, before: date, drop: bool = False) -> List[str]:
+    """Detach partitions whose whole month lies before ``before``.
+
+    Contacts of the detached trips are moved to ``contacts_archive`` and their
+    route segments deleted, so no row is left pointing at a missing trip. With
+    ``drop`` the trips themselves are copied to ``trips_archive`` before the
+    partition is dropped.
+    """
+    detached = []
+    for name in await list_partitions(engine):
+        match = PARTITION_NAME.match(name)
+        if not match or month_start(date(int(match[1]), int(match[2]), 1), 1) > before:
+            continue
+        async with engine.begin() as conn:
+            trip_ids = f'SELECT id FROM {name}'
+            await conn.execute(text(
+                'INSERT INTO contacts_archive (id, trip_id, passenger_id, archived_at) '
+                "SELECT id, trip_id, passenger_id, now() AT TIME ZONE 'utc' "
+                f'FROM contacts WHERE trip_id IN ({trip_ids})'
+            ))
+            await conn.execute(text(f'DELETE FROM contacts WHERE trip_id IN ({trip_ids})'))
+            await conn.execute(text(f'DELETE FROM trip_segments WHERE trip_id IN ({trip_ids})'))
+            await conn.execute(text(f'ALTER TABLE trips DETACH PARTITION {name}'))
+            if drop:
+                await conn.execute(text(
+                    f'INSERT INTO trips_archive ({ARCHIVE_COLUMNS}, archived_at) '
+                    f"SELECT {ARCHIVE_COLUMNS}, now() AT TIME ZONE 'utc' FROM {name}"
+                ))
+                await conn.execute(text(f'DROP TABLE {name}'))
+        logger.info('%s partition %s', 'Dropped' if drop else 'Detached', name)
+        detached.append(name)
+    return detached
+
+
+class PartitionMaintainer:
+    """Keeps ``months_ahead`` future partitions in place while the bot runs."""
+
+    def __init__(self, engine: AsyncEngine, months_ahead: int = 3, interval: float = 86400) -> None:
+        self._engine = engine
+        self._months_ahead = months_ahead
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if await is_partitioned(self._engine):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await create_partitions(self._engine, self._months_ahead)
+            except Exception:
+                logger.exception('Creating trip partitions failed')
+            await asyncio.sleep(self._interval)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    config = Config.load(args.config)
+    engine = create_async_engine(config.db_url)
+    try:
+        if args.command == 'create':
+            names = await create_partitions(engine, args.months)
+        else:
+            names = await detach_partitions(engine, date.fromisoformat(args.before), args.drop)
+        print('\n'.join(names) or 'nothing to do')
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='config.json')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='create partitions for the coming months')
+    create.add_argument('--months', type=int, default=3)
+    detach = commands.add_parser('detach', help='detach partitions of months that ended')
+    detach.add_argument('--before', default=month_start(date.today()).isoformat())
+    detach.add_argument('--drop', action='store_true')
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID
+
+from .storage import Followup, Storage
+
+logger = logging.getLogger(__name__)
+
+FollowupHandler = Callable[[Followup], Awaitable[None]]
+
+
+class FollowupScheduler:
+    """Single timer worker that fires persisted follow-ups when they become due.
+
+    Pending follow-ups live in the storage so they survive restarts; the worker
+    keeps a min-heap ordered by ``run_at`` and sleeps until the earliest one.
+    """
+
+    def __init__(self, storage: Storage, handler: FollowupHandler, batch_size: int = 50) -> None:
+        self._storage = storage
+        self._handler = handler
+        self._batch_size = batch_size
+        self._heap: List[Tuple[datetime, int, Followup]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def start(self) -> None:
+        for followup in await self._storage.list_followups():
+            self._push(followup)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # wait_for() may swallow the cancellation when the wakeup fires at the
+            # same moment, so the loop also checks the flag.
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._stopping = False
+
+    async def schedule(self, trip_id: UUID, chat_id: int, language: str, delay: int) -> bool:
+        followup = Followup(
+            trip_id=trip_id,
+            chat_id=chat_id,
+            language=language,
+            run_at=datetime.utcnow() + timedelta(seconds=delay),
+        )
+        if not await self._storage.add_followup(followup):
+            return False
+        self._push(followup)
+        return True
+
+    def _push(self, followup: Followup) -> None:
+        heapq.heappush(self._heap, (followup.run_at, next(self._seq), followup))
+        self._wakeup.set()
+
+    def _pop_due(self) -> List[Followup]:
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self._batch_size:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            due = self._pop_due()
+            if due:
+                await self._fire(due)
+                continue
+            timeout = (self._heap[0][0] - datetime.utcnow()).total_seconds() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, due: List[Followup]) -> None:
+        try:
+            # Claiming first keeps several bot processes from sending the same follow-up twice.
+            claimed = set(await self._storage.claim_followups([f.id for f in due]))
+        except Exception:
+            logger.exception('Failed to claim %d follow-ups, retrying later', len(due))
+            await asyncio.sleep(1)
+            for followup in due:
+                self._push(followup)
+            return
+        batch = [f for f in due if f.id in claimed]
+        results = await asyncio.gather(*(self._handler(f) for f in batch), return_exceptions=True)
+        for followup, result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error('Follow-up %s to chat %s failed: %r', followup.id, followup.chat_id, result)
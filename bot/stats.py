@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from .storage import ROUTE_FIELDS, Storage, Trip, TripActivity
+
+logger = logging.getLogger(__name__)
+
+Route = Tuple[str, str]
+
+
+@dataclass
+class RouteStats:
+    trips: int = 0
+    contacts: int = 0
+
+
+@dataclass
+class _TripEntry:
+    driver_id: int
+    route: Route
+    day: date
+    contacts: int = 0
+
+
+class TripStats:
+    """Activity counters for the current trips, maintained as writes happen.
+
+    Holds contacts per trip, trips and contacts per route and departure day,
+    and trips per driver, so every figure is read with a dict lookup instead
+    of a scan of ``trips`` and ``contacts``. :class:`StatsStorage` updates the
+    counters; :class:`StatsReconciler` periodically replaces them with a fresh
+    count from the storage to correct any drift.
+    """
+
+    def __init__(self) -> None:
+        self._trips: Dict[UUID, _TripEntry] = {}
+        self._days: Dict[date, Dict[Route, RouteStats]] = {}
+        self._drivers: Dict[int, int] = {}
+
+    @property
+    def active_trips(self) -> int:
+        return len(self._trips)
+
+    @property
+    def active_drivers(self) -> int:
+        return len(self._drivers)
+
+    def trip_contacts(self, trip_id: UUID) -> int:
+        entry = self._trips.get(trip_id)
+        return entry.contacts if entry else 0
+
+    def route(self, from_city: str, to_city: str, day: date) -> RouteStats:
+        stats = self._days.get(day, {}).get((from_city, to_city))
+        return RouteStats(stats.trips, stats.contacts) if stats else RouteStats()
+
+    def day(self, day: date) -> RouteStats:
+        routes = self._days.get(day, {}).values()
+        return RouteStats(sum(r.trips for r in routes), sum(r.contacts for r in routes))
+
+    def top_routes(self, day: date, n: int = 5) -> List[Tuple[Route, RouteStats]]:
+        routes = self._days.get(day, {})
+        return heapq.nlargest(n, routes.items(), key=lambda item: (item[1].contacts, item[1].trips))
+
+    def add_trip(self, trip_id: UUID, driver_id: int, route: Route, day: date, contacts: int = 0) -> None:
+        if trip_id in self._trips:
+            self.remove_trip(trip_id)
+        self._trips[trip_id] = _TripEntry(driver_id, route, day, contacts)
+        stats = self._days.setdefault(day, {}).setdefault(route, RouteStats())
+        stats.trips += 1
+        stats.contacts += contacts
+        self._drivers[driver_id] = self._drivers.get(driver_id, 0) + 1
+
+    def remove_trip(self, trip_id: UUID) -> None:
+        entry = self._trips.pop(trip_id, None)
+        if entry is None:
+            return
+        routes = self._days[entry.day]
+        stats = routes[entry.route]
+        stats.trips -= 1
+        stats.contacts -= entry.contacts
+        if not stats.trips:
+            del routes[entry.route]
+            if not routes:
+                del self._days[entry.day]
+        self._drivers[entry.driver_id] -= 1
+        if not self._drivers[entry.driver_id]:
+            del self._drivers[entry.driver_id]
+
+    def move_trip(self, trip_id: UUID, from_city: str, to_city: str, day: date) -> None:
+        entry = self._trips.get(trip_id)
+        if entry:
+            self.add_trip(trip_id, entry.driver_id, (from_city, to_city), day, entry.contacts)
+
+    def add_contacts(self, trip_ids: Iterable[UUID]) -> None:
+        for trip_id in trip_ids:
+            entry = self._trips.get(trip_id)
+            # Contacts of trips that are already gone only matter to the archive.
+            if entry:
+                entry.contacts += 1
+                self._days[entry.day][entry.route].contacts += 1
+
+    def reset(self, activity: Iterable[TripActivity]) -> int:
+        """Replace all counters with ``activity``; returns how many trips had drifted."""
+        before = {trip_id: (e.driver_id, e.route, e.day, e.contacts) for trip_id, e in self._trips.items()}
+        self._trips.clear()
+        self._days.clear()
+        self._drivers.clear()
+        for trip_id, driver_id, from_city, to_city, day, contacts in activity:
+            self.add_trip(trip_id, driver_id, (from_city, to_city), day, contacts)
+        after = {trip_id: (e.driver_id, e.route, e.day, e.contacts) for trip_id, e in self._trips.items()}
+        changed = sum(before.get(trip_id) != value for trip_id, value in after.items())
+        return changed + len(before.keys() - after.keys())
+
+
+class StatsStorage:
+    """Storage proxy that updates :class:`TripStats` after every successful write that affects it.
+
+    Every other attribute is delegated to the wrapped storage unchanged.
+    """
+
+    def __init__(self, storage: Storage, stats: TripStats) -> None:
+        self._storage = storage
+        self.stats = stats
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._storage, name)
+
+    async def create_trip(self, trip: Trip) -> None:
+        await self._storage.create_trip(trip)
+        self.stats.add_trip(trip.id, trip.driver_id, (trip.from_city, trip.to_city), trip.departure_date)
+
+    async def delete_trip(self, trip_id: UUID) -> None:
+        await self._storage.delete_trip(trip_id)
+        self.stats.remove_trip(trip_id)
+
+    async def update_trip(self, trip_id: UUID, data: dict) -> None:
+        await self._storage.update_trip(trip_id, data)
+        if ROUTE_FIELDS & data.keys():
+            trip = await self._storage.get_trip(trip_id)
+            if trip:
+                self.stats.move_trip(trip_id, trip.from_city, trip.to_city, trip.departure_date)
+
+    async def archive_trips(self, before: date, limit: int) -> Tuple[List[UUID], int]:
+        trip_ids, contacts = await self._storage.archive_trips(before, limit)
+        for trip_id in trip_ids:
+            self.stats.remove_trip(trip_id)
+        return trip_ids, contacts
+
+    async def record_contact(self, trip_id: UUID, passenger_id: int) -> None:
+        await self._storage.record_contact(trip_id, passenger_id)
+        self.stats.add_contacts([trip_id])
+
+    async def record_contacts(self, contacts: List[Tuple[UUID, int]]) -> None:
+        await self._storage.record_contacts(contacts)
+        self.stats.add_contacts(trip_id for trip_id, _ in contacts)
+
+
+class StatsReconciler:
+    """Background task that recounts :class:`TripStats` from the storage.
+
+    Runs once on start, which is how the counters are filled after a restart,
+    and then every ``interval`` seconds. Writes that land while the recount is
+    being read can be missed; the next run picks them up.
+    """
+
+    def __init__(self, storage: Storage, stats: TripStats, interval: float = 600) -> None:
+        self._storage = storage
+        self._stats = stats
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._filled = False
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> int:
+        start = time.perf_counter()
+        activity = await self._storage.trip_activity()
+        drifted = self._stats.reset(activity)
+        # The first run fills empty counters, which is not drift.
+        if not self._filled:
+            drifted, self._filled = 0, True
+        logger.log(
+            logging.WARNING if drifted else logging.INFO,
+            'Recounted stats of %d trips, %d had drifted, %.3fs',
+            len(activity), drifted, time.perf_counter() - start,
+        )
+        return drifted
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception('Recounting trip stats failed')
+            await asyncio.sleep(self._interval)
@@ -1,33 +1,58 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from datetime import date, datetime
+import asyncio
+import sys
+import time
+from dataclasses import dataclass, field, fields, replace
+from datetime import date, datetime, timedelta
 from datetime import time as dt_time
-from threading import Lock
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from uuid import UUID, uuid4
 
 from sqlalchemy import (
     JSON,
     Date,
     DateTime,
-    ForeignKey,
+    Index,
     Integer,
     String,
+    Text,
     Time,
+    UniqueConstraint,
+    and_,
     delete,
+    func,
+    insert,
+    literal,
+    or_,
     select,
+    tuple_,
     update,
 )
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 FileID = str
 
+_shared: Dict[Any, Any] = {}
 
-@dataclass
+
+def _share(value: Any) -> Any:
+    """Return a canonical instance of an immutable value such as a date or time."""
+    return value if value is None else _shared.setdefault(value, value)
+
+
+@dataclass(slots=True)
 class Trip:
+    """A published trip.
+
+    Instances are slotted and share their city strings, dates and times with
+    other trips so that large in-memory collections stay compact.
+    """
+
     id: UUID
     driver_id: int
     from_city: str
@@ -38,16 +63,99 @@ class Trip:
     price: Optional[str]
     phone: str
     car: Optional[str]
-    photos: List[FileID]
+    photos: Tuple[FileID, ...]
     comment: Optional[str]
     created_at: datetime = field(default_factory=datetime.utcnow)
+    stops: Tuple[str, ...] = ()  # intermediate cities in travel order
+
+    def __post_init__(self) -> None:
+        self.from_city = sys.intern(self.from_city)
+        self.to_city = sys.intern(self.to_city)
+        self.departure_date = _share(self.departure_date)
+        self.time = _share(self.time)
+        self.photos = tuple(self.photos)
+        self.stops = tuple(sys.intern(city) for city in self.stops)
+
+
+TripCursor = Tuple[date, dt_time, UUID]
+
+# Trips without a departure time sort after every timed trip of the same day.
+UNTIMED = dt_time.max
+
+# ``[start, end)`` time of day; a window with ``start > end`` wraps past midnight.
+TimeWindow = Tuple[dt_time, dt_time]
+
+# ``(trip_id, driver_id, from_city, to_city, departure_date, contacts)`` of a current trip.
+TripActivity = Tuple[UUID, int, str, str, date, int]
+
+
+def trip_cursor(trip: Trip) -> TripCursor:
+    return trip.departure_date, trip.time or UNTIMED, trip.id
+
+
+def trip_segments(trip: Trip) -> List[Tuple[str, str]]:
+    """Every (origin, destination) pair a passenger can ride along the trip's route."""
+    points = list(dict.fromkeys((trip.from_city, *trip.stops, trip.to_city)))
+    return [(origin, destination) for i, origin in enumerate(points) for destination in points[i + 1:]]
+
+
+def in_window(value: Optional[dt_time], window: Optional[TimeWindow]) -> bool:
+    """Whether a departure time falls into ``window``; trips without a time match every window."""
+    if window is None or value is None:
+        return True
+    start, end = window
+    if start <= end:
+        return start <= value < end
+    return value >= start or value < end
+
+
+@dataclass
+class Followup:
+    trip_id: UUID
+    chat_id: int
+    language: str
+    run_at: datetime
+    id: UUID = field(default_factory=uuid4)
+
+
+@dataclass
+class Subscription:
+    """A passenger's saved search for trips on a route within a date range."""
+
+    chat_id: int
+    from_city: str
+    to_city: str
+    first_date: date
+    last_date: date
+    language: str
+    id: UUID = field(default_factory=uuid4)
+    created_at: datetime = field(default_factory=datetime.utcnow)
 
 
 class Storage:
     async def create_trip(self, trip: Trip) -> None:
         raise NotImplementedError
 
-    async def search_trips(self, from_city: str, to_city: str, departure_date: date) -> List[Trip]:
+    async def search_trips(
+        self,
+        from_city: str,
+        to_city: str,
+        departure_date: date,
+        limit: Optional[int] = None,
+        after: Optional[TripCursor] = None,
+        before: Optional[TripCursor] = None,
+        last_date: Optional[date] = None,
+        window: Optional[TimeWindow] = None,
+    ) -> List[Trip]:
+        """Trips that pass ``from_city`` and then ``to_city``, ordered by :func:`trip_cursor`.
+
+        Besides direct trips this finds trips where either city is one of the
+        stops. Trips depart from ``departure_date`` through ``last_date`` (the same day
+        if omitted) and, when ``window`` is given, within that time of day.
+        ``after``/``before`` are keyset cursors of the neighbouring page; with
+        ``before`` the page immediately preceding the cursor is returned, still
+        in ascending order.
+        """
         raise NotImplementedError
 
     async def get_trip(self, trip_id: UUID) -> Optional[Trip]:
@@ -59,69 +167,261 @@ class Storage:
     async def update_trip(self, trip_id: UUID, data: dict) -> None:
         raise NotImplementedError
 
+    async def book_seats(self, trip_id: UUID, seats: int = 1) -> bool:
+        """Take ``seats`` free seats of a trip in one atomic step; False if there are not that many left."""
+        raise NotImplementedError
+
     async def list_driver_trips(self, driver_id: int) -> List[Trip]:
         raise NotImplementedError
 
     async def record_contact(self, trip_id: UUID, passenger_id: int) -> None:
         raise NotImplementedError
 
+    async def record_contacts(self, contacts: List[Tuple[UUID, int]]) -> None:
+        """Record several ``(trip_id, passenger_id)`` contacts in one write."""
+        raise NotImplementedError
+
+    async def trip_activity(self) -> List[TripActivity]:
+        """Route, day, driver and number of contacts of every current trip."""
+        raise NotImplementedError
+
+    async def archive_trips(self, before: date, limit: int) -> Tuple[List[UUID], int]:
+        """Move up to ``limit`` trips departing before ``before`` and their contacts to the archive.
+
+        Returns the ids of the trips moved and the number of contacts moved.
+        """
+        raise NotImplementedError
+
     async def set_language(self, user_id: int, language: str) -> None:
         raise NotImplementedError
 
     async def get_language(self, user_id: int, default: str = 'ru') -> str:
         raise NotImplementedError
 
+    async def add_followup(self, followup: Followup) -> bool:
+        """Persist a follow-up unless one is already pending for the same chat and trip."""
+        raise NotImplementedError
+
+    async def list_followups(self) -> List[Followup]:
+        raise NotImplementedError
+
+    async def claim_followups(self, followup_ids: Iterable[UUID]) -> List[UUID]:
+        """Delete pending follow-ups and return the ids that were still pending."""
+        raise NotImplementedError
+
+    async def add_subscription(self, subscription: Subscription) -> bool:
+        """Persist a saved search unless the chat already has the same one."""
+        raise NotImplementedError
+
+    async def list_subscriptions(self, since: date, created_after: Optional[datetime] = None) -> List[Subscription]:
+        """Saved searches whose date range has not ended before ``since``.
+
+        With ``created_after`` only those saved later than that are returned.
+        """
+        raise NotImplementedError
+
+    async def expire_subscriptions(self, before: date) -> int:
+        """Delete saved searches whose date range ended before ``before``."""
+        raise NotImplementedError
+
+
+RouteKey = Tuple[str, str, date]
+
+
+def _route_keys(trip: Trip) -> List[RouteKey]:
+    return [(origin, destination, trip.departure_date) for origin, destination in trip_segments(trip)]
+
+
+def _subscription_key(subscription: Subscription) -> Tuple[Any, ...]:
+    return (
+        subscription.chat_id,
+        subscription.from_city,
+        subscription.to_city,
+        subscription.first_date,
+        subscription.last_date,
+    )
+
 
 class MemoryStorage(Storage):
     def __init__(self) -> None:
         self._trips: Dict[UUID, Trip] = {}
+        # Keyed by every segment of a trip's route, so pass-through trips are a direct lookup.
+        self._by_route: Dict[RouteKey, Dict[UUID, Trip]] = {}
+        self._by_driver: Dict[int, Dict[UUID, Trip]] = {}
         self._contacts: Dict[UUID, List[int]] = {}
+        self._archived_trips: Dict[UUID, Trip] = {}
+        self._archived_contacts: Dict[UUID, List[int]] = {}
         self._languages: Dict[int, str] = {}
-        self._lock = Lock()
+        self._followups: Dict[UUID, Followup] = {}
+        self._followup_keys: Dict[Tuple[int, UUID], UUID] = {}
+        self._subscriptions: Dict[UUID, Subscription] = {}
+        self._subscription_keys: Dict[Tuple[Any, ...], UUID] = {}
+        # Writers serialize on the lock; readers never await, so on the event loop
+        # they always observe the trips and both indexes in a consistent state.
+        self._lock = asyncio.Lock()
+
+    def _index(self, trip: Trip) -> None:
+        self._trips[trip.id] = trip
+        for key in _route_keys(trip):
+            self._by_route.setdefault(key, {})[trip.id] = trip
+        self._by_driver.setdefault(trip.driver_id, {})[trip.id] = trip
+
+    def _unindex(self, trip: Trip) -> None:
+        self._trips.pop(trip.id, None)
+        keys = [(self._by_route, key) for key in _route_keys(trip)] + [(self._by_driver, trip.driver_id)]
+        for index, key in keys:
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(trip.id, None)
+                if not bucket:
+                    del index[key]
 
     async def create_trip(self, trip: Trip) -> None:
-        with self._lock:
-            self._trips[trip.id] = trip
-
-    async def search_trips(self, from_city: str, to_city: str, departure_date: date) -> List[Trip]:
-        with self._lock:
-            return [
-                t for t in self._trips.values()
-                if t.from_city == from_city and t.to_city == to_city and t.departure_date == departure_date
-            ]
+        async with self._lock:
+            old = self._trips.get(trip.id)
+            if old:
+                self._unindex(old)
+            self._index(trip)
+
+    async def search_trips(
+        self,
+        from_city: str,
+        to_city: str,
+        departure_date: date,
+        limit: Optional[int] = None,
+        after: Optional[TripCursor] = None,
+        before: Optional[TripCursor] = None,
+        last_date: Optional[date] = None,
+        window: Optional[TimeWindow] = None,
+    ) -> List[Trip]:
+        trips = []
+        for offset in range(((last_date or departure_date) - departure_date).days + 1):
+            bucket = self._by_route.get((from_city, to_city, departure_date + timedelta(days=offset)), {})
+            trips.extend(t for t in bucket.values() if in_window(t.time, window))
+        trips.sort(key=trip_cursor)
+        if after:
+            trips = [t for t in trips if trip_cursor(t) > after]
+        if before:
+            trips = [t for t in trips if trip_cursor(t) < before]
+            return trips[-limit:] if limit else trips
+        return trips[:limit] if limit else trips
 
     async def get_trip(self, trip_id: UUID) -> Optional[Trip]:
-        with self._lock:
-            return self._trips.get(trip_id)
+        return self._trips.get(trip_id)
 
     async def delete_trip(self, trip_id: UUID) -> None:
-        with self._lock:
-            self._trips.pop(trip_id, None)
+        async with self._lock:
+            trip = self._trips.get(trip_id)
+            if trip:
+                self._unindex(trip)
             self._contacts.pop(trip_id, None)
 
     async def update_trip(self, trip_id: UUID, data: dict) -> None:
-        with self._lock:
+        async with self._lock:
             trip = self._trips.get(trip_id)
             if not trip:
                 return
-            for k, v in data.items():
-                setattr(trip, k, v)
+            # A new instance, so __post_init__ normalizes and shares the updated fields.
+            updated = replace(trip, **data)
+            self._unindex(trip)
+            self._index(updated)
+
+    async def book_seats(self, trip_id: UUID, seats: int = 1) -> bool:
+        async with self._lock:
+            trip = self._trips.get(trip_id)
+            if not trip or trip.seats < seats:
+                return False
+            trip.seats -= seats
+            return True
 
     async def list_driver_trips(self, driver_id: int) -> List[Trip]:
-        with self._lock:
-            return [t for t in self._trips.values() if t.driver_id == driver_id]
+        return list(self._by_driver.get(driver_id, {}).values())
 
     async def record_contact(self, trip_id: UUID, passenger_id: int) -> None:
-        with self._lock:
+        async with self._lock:
             self._contacts.setdefault(trip_id, []).append(passenger_id)
 
+    async def record_contacts(self, contacts: List[Tuple[UUID, int]]) -> None:
+        async with self._lock:
+            for trip_id, passenger_id in contacts:
+                self._contacts.setdefault(trip_id, []).append(passenger_id)
+
+    async def trip_activity(self) -> List[TripActivity]:
+        return [
+            (t.id, t.driver_id, t.from_city, t.to_city, t.departure_date, len(self._contacts.get(t.id, ())))
+            for t in self._trips.values()
+        ]
+
+    async def archive_trips(self, before: date, limit: int) -> Tuple[List[UUID], int]:
+        async with self._lock:
+            # A trip with stops sits in several route buckets, hence the dict.
+            found: Dict[UUID, Trip] = {}
+            for key in [key for key in self._by_route if key[2] < before]:
+                found.update(self._by_route[key])
+                if len(found) >= limit:
+                    break
+            expired = list(found.values())[:limit]
+            contacts = 0
+            for trip in expired:
+                self._unindex(trip)
+                self._archived_trips[trip.id] = trip
+                passengers = self._contacts.pop(trip.id, [])
+                if passengers:
+                    self._archived_contacts.setdefault(trip.id, []).extend(passengers)
+                    contacts += len(passengers)
+            return [trip.id for trip in expired], contacts
+
     async def set_language(self, user_id: int, language: str) -> None:
-        with self._lock:
+        async with self._lock:
             self._languages[user_id] = language
 
     async def get_language(self, user_id: int, default: str = 'ru') -> str:
-        with self._lock:
-            return self._languages.get(user_id, default)
+        return self._languages.get(user_id, default)
+
+    async def add_followup(self, followup: Followup) -> bool:
+        async with self._lock:
+            key = (followup.chat_id, followup.trip_id)
+            if key in self._followup_keys:
+                return False
+            self._followup_keys[key] = followup.id
+            self._followups[followup.id] = followup
+            return True
+
+    async def list_followups(self) -> List[Followup]:
+        return list(self._followups.values())
+
+    async def claim_followups(self, followup_ids: Iterable[UUID]) -> List[UUID]:
+        async with self._lock:
+            claimed = []
+            for followup_id in followup_ids:
+                followup = self._followups.pop(followup_id, None)
+                if followup:
+                    del self._followup_keys[(followup.chat_id, followup.trip_id)]
+                    claimed.append(followup_id)
+            return claimed
+
+    async def add_subscription(self, subscription: Subscription) -> bool:
+        async with self._lock:
+            key = _subscription_key(subscription)
+            if key in self._subscription_keys:
+                return False
+            self._subscription_keys[key] = subscription.id
+            self._subscriptions[subscription.id] = subscription
+            return True
+
+    async def list_subscriptions(self, since: date, created_after: Optional[datetime] = None) -> List[Subscription]:
+        return [
+            s for s in self._subscriptions.values()
+            if s.last_date >= since and (created_after is None or s.created_at > created_after)
+        ]
+
+    async def expire_subscriptions(self, before: date) -> int:
+        async with self._lock:
+            expired = [s for s in self._subscriptions.values() if s.last_date < before]
+            for subscription in expired:
+                del self._subscriptions[subscription.id]
+                del self._subscription_keys[_subscription_key(subscription)]
+            return len(expired)
 
 
 class Base(DeclarativeBase):
@@ -130,6 +430,9 @@ class Base(DeclarativeBase):
 
 class TripModel(Base):
     __tablename__ = 'trips'
+    __table_args__ = (
+        Index('ix_trips_driver_id', 'driver_id'),
+    )
 
     id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True, default=uuid4)
     driver_id: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -144,6 +447,7 @@ class TripModel(Base):
     photos: Mapped[List[FileID]] = mapped_column(JSON, nullable=False)
     comment: Mapped[Optional[str]] = mapped_column(String)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    stops: Mapped[List[str]] = mapped_column(JSON, nullable=False, default=list)
 
     @classmethod
     def from_dataclass(cls, trip: Trip) -> 'TripModel':
@@ -158,9 +462,10 @@ class TripModel(Base):
             price=trip.price,
             phone=trip.phone,
             car=trip.car,
-            photos=trip.photos,
+            photos=list(trip.photos),
             comment=trip.comment,
             created_at=trip.created_at,
+            stops=list(trip.stops),
         )
 
     def to_dataclass(self) -> Trip:
@@ -178,17 +483,126 @@ class TripModel(Base):
             photos=self.photos,
             comment=self.comment,
             created_at=self.created_at,
+            stops=self.stops,
         )
 
 
+# Changing any of these moves the trip's segments.
+ROUTE_FIELDS = frozenset({'from_city', 'to_city', 'stops', 'departure_date'})
+
+# Trip's fields in declaration order, so ``Trip(*row)`` builds a trip straight from a
+# Core result row without materializing a TripModel.
+TRIP_COLUMNS = tuple(TripModel.__table__.c[f.name] for f in fields(Trip))
+
+
+class TripSegmentModel(Base):
+    """One row per (origin, destination) pair along a trip's route, see :func:`trip_segments`."""
+
+    __tablename__ = 'trip_segments'
+    # trip_id is part of the index so searches are answered from the index alone.
+    __table_args__ = (Index('ix_trip_segments_route_date', 'from_city', 'to_city', 'departure_date', 'trip_id'),)
+
+    trip_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True)
+    from_city: Mapped[str] = mapped_column(String, primary_key=True)
+    to_city: Mapped[str] = mapped_column(String, primary_key=True)
+    departure_date: Mapped[date] = mapped_column(Date, nullable=False)
+
+    @classmethod
+    def for_trip(cls, trip: Trip) -> List['TripSegmentModel']:
+        return [
+            cls(trip_id=trip.id, from_city=origin, to_city=destination, departure_date=trip.departure_date)
+            for origin, destination in trip_segments(trip)
+        ]
+
+
 class ContactModel(Base):
     __tablename__ = 'contacts'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    trip_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), ForeignKey('trips.id'))
+    # No foreign key: trips is partitioned by departure_date, so trips.id alone is not unique there.
+    trip_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), index=True)
     passenger_id: Mapped[int] = mapped_column(Integer, nullable=False)
 
 
+class TripArchiveModel(Base):
+    __tablename__ = 'trips_archive'
+
+    id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True)
+    driver_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    from_city: Mapped[str] = mapped_column(String, nullable=False)
+    to_city: Mapped[str] = mapped_column(String, nullable=False)
+    departure_date: Mapped[date] = mapped_column(Date, nullable=False)
+    time: Mapped[Optional[dt_time]] = mapped_column(Time)
+    seats: Mapped[int] = mapped_column(Integer, nullable=False)
+    price: Mapped[Optional[str]] = mapped_column(String)
+    phone: Mapped[str] = mapped_column(String, nullable=False)
+    car: Mapped[Optional[str]] = mapped_column(String)
+    photos: Mapped[List[FileID]] = mapped_column(JSON, nullable=False)
+    comment: Mapped[Optional[str]] = mapped_column(String)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    stops: Mapped[List[str]] = mapped_column(JSON, nullable=False, default=list)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class ContactArchiveModel(Base):
+    __tablename__ = 'contacts_archive'
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    trip_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), index=True)
+    passenger_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class FollowupModel(Base):
+    __tablename__ = 'followups'
+    __table_args__ = (UniqueConstraint('chat_id', 'trip_id', name='uq_followups_chat_trip'),)
+
+    id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True, default=uuid4)
+    trip_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), nullable=False)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    language: Mapped[str] = mapped_column(String, nullable=False)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def to_dataclass(self) -> Followup:
+        return Followup(
+            id=self.id,
+            trip_id=self.trip_id,
+            chat_id=self.chat_id,
+            language=self.language,
+            run_at=self.run_at,
+        )
+
+
+class SubscriptionModel(Base):
+    __tablename__ = 'subscriptions'
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'from_city', 'to_city', 'first_date', 'last_date', name='uq_subscriptions_search'),
+        Index('ix_subscriptions_last_date', 'last_date'),
+        Index('ix_subscriptions_created_at', 'created_at'),
+    )
+
+    id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True, default=uuid4)
+    chat_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    from_city: Mapped[str] = mapped_column(String, nullable=False)
+    to_city: Mapped[str] = mapped_column(String, nullable=False)
+    first_date: Mapped[date] = mapped_column(Date, nullable=False)
+    last_date: Mapped[date] = mapped_column(Date, nullable=False)
+    language: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    def to_dataclass(self) -> Subscription:
+        return Subscription(
+            id=self.id,
+            chat_id=self.chat_id,
+            from_city=self.from_city,
+            to_city=self.to_city,
+            first_date=self.first_date,
+            last_date=self.last_date,
+            language=self.language,
+            created_at=self.created_at,
+        )
+
+
 class UserModel(Base):
     __tablename__ = 'users'
 
@@ -196,13 +610,74 @@ class UserModel(Base):
     language: Mapped[str] = mapped_column(String, nullable=False)
 
 
+class FSMStateModel(Base):
+    __tablename__ = 'fsm_states'
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String)
+    data: Mapped[str] = mapped_column(Text, nullable=False)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a free connection."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+
 class SQLStorage(Storage):
     def __init__(self, session_maker: async_sessionmaker[AsyncSession]):
         self._session_maker = session_maker
 
+    @property
+    def session_maker(self) -> async_sessionmaker[AsyncSession]:
+        return self._session_maker
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self._session_maker.kw['bind']
+
+    def pool_stats(self) -> Dict[str, float]:
+        pool = self.engine.sync_engine.pool
+        stats: Dict[str, float] = {}
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+            )
+        if isinstance(pool, TimedQueuePool):
+            stats.update(
+                checkouts=pool.checkouts,
+                timeouts=pool.timeouts,
+                wait_seconds_total=pool.wait_time,
+                wait_seconds_max=pool.max_wait,
+            )
+        return stats
+
     @classmethod
-    async def create(cls, url: str) -> 'SQLStorage':
-        engine = create_async_engine(url)
+    async def create(cls, url: str, **engine_options: Any) -> 'SQLStorage':
+        if 'pool_size' in engine_options:
+            engine_options.setdefault('poolclass', TimedQueuePool)
+        engine = create_async_engine(url, **engine_options)
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         session_maker = async_sessionmaker(engine, expire_on_commit=False)
@@ -211,44 +686,148 @@ class SQLStorage(Storage):
     async def create_trip(self, trip: Trip) -> None:
         async with self._session_maker() as session:
             session.add(TripModel.from_dataclass(trip))
+            session.add_all(TripSegmentModel.for_trip(trip))
             await session.commit()
 
-    async def search_trips(self, from_city: str, to_city: str, departure_date: date) -> List[Trip]:
+    async def search_trips(
+        self,
+        from_city: str,
+        to_city: str,
+        departure_date: date,
+        limit: Optional[int] = None,
+        after: Optional[TripCursor] = None,
+        before: Optional[TripCursor] = None,
+        last_date: Optional[date] = None,
+        window: Optional[TimeWindow] = None,
+    ) -> List[Trip]:
+        order = (TripModel.departure_date, func.coalesce(TripModel.time, UNTIMED), TripModel.id)
+        segment = TripSegmentModel
+        query = select(*TRIP_COLUMNS).join(
+            # departure_date in the join lets Postgres prune trips partitions.
+            segment, and_(segment.trip_id == TripModel.id, segment.departure_date == TripModel.departure_date)
+        ).where(
+            segment.from_city == from_city,
+            segment.to_city == to_city,
+            segment.departure_date.between(departure_date, last_date or departure_date),
+        )
+        if window:
+            start, end = window
+            if start <= end:
+                in_time = and_(TripModel.time >= start, TripModel.time < end)
+            else:
+                in_time = or_(TripModel.time >= start, TripModel.time < end)
+            query = query.where(or_(TripModel.time.is_(None), in_time))
+        if after:
+            query = query.where(tuple_(*order) > tuple_(*after))
+        if before:
+            query = query.where(tuple_(*order) < tuple_(*before))
+        query = query.order_by(*(c.desc() for c in order) if before else order).limit(limit)
         async with self._session_maker() as session:
-            result = await session.execute(
-                select(TripModel).where(
-                    TripModel.from_city == from_city,
-                    TripModel.to_city == to_city,
-                    TripModel.departure_date == departure_date,
-                )
-            )
-            return [row[0].to_dataclass() for row in result.all()]
+            result = await session.execute(query)
+            trips = [Trip(*row) for row in result.all()]
+        return trips[::-1] if before else trips
 
     async def get_trip(self, trip_id: UUID) -> Optional[Trip]:
         async with self._session_maker() as session:
-            obj = await session.get(TripModel, trip_id)
-            return obj.to_dataclass() if obj else None
+            result = await session.execute(select(*TRIP_COLUMNS).where(TripModel.id == trip_id))
+            row = result.first()
+            return Trip(*row) if row else None
 
     async def delete_trip(self, trip_id: UUID) -> None:
         async with self._session_maker() as session:
+            await session.execute(delete(TripSegmentModel).where(TripSegmentModel.trip_id == trip_id))
             await session.execute(delete(TripModel).where(TripModel.id == trip_id))
             await session.commit()
 
     async def update_trip(self, trip_id: UUID, data: dict) -> None:
         async with self._session_maker() as session:
             await session.execute(update(TripModel).where(TripModel.id == trip_id).values(**data))
+            if ROUTE_FIELDS & data.keys():
+                await session.execute(delete(TripSegmentModel).where(TripSegmentModel.trip_id == trip_id))
+                row = (await session.execute(select(*TRIP_COLUMNS).where(TripModel.id == trip_id))).first()
+                if row:
+                    session.add_all(TripSegmentModel.for_trip(Trip(*row)))
+            await session.commit()
+
+    async def book_seats(self, trip_id: UUID, seats: int = 1) -> bool:
+        # The check and the decrement are one statement, so concurrent bookings
+        # serialize on the row lock and none of them reads a stale count.
+        async with self._session_maker() as session:
+            result = await session.execute(
+                update(TripModel)
+                .where(TripModel.id == trip_id, TripModel.seats >= seats)
+                .values(seats=TripModel.seats - seats)
+            )
             await session.commit()
+            return result.rowcount == 1
 
     async def list_driver_trips(self, driver_id: int) -> List[Trip]:
         async with self._session_maker() as session:
-            result = await session.execute(select(TripModel).where(TripModel.driver_id == driver_id))
-            return [row[0].to_dataclass() for row in result.all()]
+            result = await session.execute(select(*TRIP_COLUMNS).where(TripModel.driver_id == driver_id))
+            return [Trip(*row) for row in result.all()]
 
     async def record_contact(self, trip_id: UUID, passenger_id: int) -> None:
         async with self._session_maker() as session:
             session.add(ContactModel(trip_id=trip_id, passenger_id=passenger_id))
             await session.commit()
 
+    async def record_contacts(self, contacts: List[Tuple[UUID, int]]) -> None:
+        if not contacts:
+            return
+        async with self._session_maker() as session:
+            # A single multi-row VALUES statement rather than one INSERT per contact.
+            await session.execute(insert(ContactModel).values([
+                {'trip_id': trip_id, 'passenger_id': passenger_id} for trip_id, passenger_id in contacts
+            ]))
+            await session.commit()
+
+    async def trip_activity(self) -> List[TripActivity]:
+        contacts = (
+            select(ContactModel.trip_id, func.count().label('contacts'))
+            .group_by(ContactModel.trip_id)
+            .subquery()
+        )
+        async with self._session_maker() as session:
+            result = await session.execute(
+                select(
+                    TripModel.id,
+                    TripModel.driver_id,
+                    TripModel.from_city,
+                    TripModel.to_city,
+                    TripModel.departure_date,
+                    func.coalesce(contacts.c.contacts, 0),
+                ).outerjoin(contacts, contacts.c.trip_id == TripModel.id)
+            )
+            return [tuple(row) for row in result.all()]
+
+    async def archive_trips(self, before: date, limit: int) -> Tuple[List[UUID], int]:
+        now = literal(datetime.utcnow(), DateTime)
+        async with self._session_maker() as session:
+            # SKIP LOCKED lets a concurrent reaper or a driver editing a trip carry on instead of waiting.
+            result = await session.execute(
+                select(TripModel.id)
+                .where(TripModel.departure_date < before)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            ids = list(result.scalars())
+            if not ids:
+                return [], 0
+            await session.execute(insert(TripArchiveModel).from_select(
+                [c.name for c in TRIP_COLUMNS] + ['archived_at'],
+                select(*TRIP_COLUMNS, now).where(TripModel.id.in_(ids)),
+            ))
+            contacts = await session.execute(insert(ContactArchiveModel).from_select(
+                ['id', 'trip_id', 'passenger_id', 'archived_at'],
+                select(ContactModel.id, ContactModel.trip_id, ContactModel.passenger_id, now)
+                .where(ContactModel.trip_id.in_(ids)),
+            ))
+            await session.execute(delete(ContactModel).where(ContactModel.trip_id.in_(ids)))
+            await session.execute(delete(TripSegmentModel).where(TripSegmentModel.trip_id.in_(ids)))
+            await session.execute(delete(TripModel).where(TripModel.id.in_(ids)))
+            await session.commit()
+            return ids, contacts.rowcount
+
     async def set_language(self, user_id: int, language: str) -> None:
         async with self._session_maker() as session:
             obj = await session.get(UserModel, user_id)
@@ -262,3 +841,64 @@ class SQLStorage(Storage):
         async with self._session_maker() as session:
             obj = await session.get(UserModel, user_id)
             return obj.language if obj else default
+
+    async def add_followup(self, followup: Followup) -> bool:
+        async with self._session_maker() as session:
+            session.add(FollowupModel(
+                id=followup.id,
+                trip_id=followup.trip_id,
+                chat_id=followup.chat_id,
+                language=followup.language,
+                run_at=followup.run_at,
+            ))
+            try:
+                await session.commit()
+            except IntegrityError:
+                return False
+            return True
+
+    async def list_followups(self) -> List[Followup]:
+        async with self._session_maker() as session:
+            result = await session.execute(select(FollowupModel).order_by(FollowupModel.run_at))
+            return [row[0].to_dataclass() for row in result.all()]
+
+    async def claim_followups(self, followup_ids: Iterable[UUID]) -> List[UUID]:
+        async with self._session_maker() as session:
+            result = await session.execute(
+                delete(FollowupModel).where(FollowupModel.id.in_(list(followup_ids))).returning(FollowupModel.id)
+            )
+            claimed = list(result.scalars())
+            await session.commit()
+            return claimed
+
+    async def add_subscription(self, subscription: Subscription) -> bool:
+        async with self._session_maker() as session:
+            session.add(SubscriptionModel(
+                id=subscription.id,
+                chat_id=subscription.chat_id,
+                from_city=subscription.from_city,
+                to_city=subscription.to_city,
+                first_date=subscription.first_date,
+                last_date=subscription.last_date,
+                language=subscription.language,
+                created_at=subscription.created_at,
+            ))
+            try:
+                await session.commit()
+            except IntegrityError:
+                return False
+            return True
+
+    async def list_subscriptions(self, since: date, created_after: Optional[datetime] = None) -> List[Subscription]:
+        query = select(SubscriptionModel).where(SubscriptionModel.last_date >= since)
+        if created_after is not None:
+            query = query.where(SubscriptionModel.created_at > created_after)
+        async with self._session_maker() as session:
+            result = await session.execute(query)
+            return [row[0].to_dataclass() for row in result.all()]
+
+    async def expire_subscriptions(self, before: date) -> int:
+        async with self._session_maker() as session:
+            result = await session.execute(delete(SubscriptionModel).where(SubscriptionModel.last_date < before))
+            await session.commit()
+            return result.rowcount
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from .storage import RouteKey, Storage, Subscription, Trip, trip_segments
+
+logger = logging.getLogger(__name__)
+
+# Called with the chat, its language and the new trips that matched its saved searches.
+MatchHandler = Callable[[int, str, List[Trip]], Awaitable[None]]
+
+
+class SubscriptionMatcher:
+    """Matches new trips against passengers' saved searches and notifies them in batches.
+
+    Subscriptions are persisted in the storage and held in an inverted index
+    keyed on ``(from_city, to_city, date)``, one entry per day of their range,
+    so matching a trip costs one lookup per route segment no matter how many
+    subscriptions exist. Matches are collected per chat and handed to the
+    handler ``batch_size`` chats at a time after a short ``delay``, so several
+    trips published together end up in a single message.
+
+    Several bot processes may share the database, and a search saved through
+    one of them must reach the others' indexes too. Every ``refresh_interval``
+    seconds the subscriptions saved since the previous load are read back in.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        handler: MatchHandler,
+        batch_size: int = 100,
+        delay: float = 1.0,
+        max_trips: int = 5,
+        refresh_interval: float = 60,
+    ) -> None:
+        self._storage = storage
+        self._handler = handler
+        self._batch_size = batch_size
+        self._delay = delay
+        self._max_trips = max_trips
+        self._refresh_interval = refresh_interval
+        self._loaded_at: Optional[datetime] = None
+        self._next_refresh = 0.0
+        self._subscriptions: Dict[UUID, Subscription] = {}
+        self._index: Dict[RouteKey, Dict[UUID, Subscription]] = {}
+        self._pending: Dict[int, Tuple[str, List[Trip]]] = {}
+        self._expired_on: Optional[date] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    async def start(self) -> None:
+        await self._refresh()
+        self._expired_on = date.today()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # wait_for() may swallow the cancellation when the wakeup fires at the
+            # same moment, so the loop also checks the flag.
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._stopping = False
+        # Whatever matched before shutdown still goes out while the outbox drains.
+        while self._pending:
+            await self._notify(self._take_batch())
+
+    async def subscribe(self, subscription: Subscription) -> bool:
+        if not await self._storage.add_subscription(subscription):
+            return False
+        self._add(subscription)
+        return True
+
+    def match(self, trip: Trip) -> int:
+        """Queue notifications for every saved search ``trip`` satisfies; returns how many matched."""
+        matched = 0
+        for origin, destination in trip_segments(trip):
+            for subscription in self._index.get((origin, destination, trip.departure_date), {}).values():
+                if subscription.chat_id == trip.driver_id:
+                    continue
+                _, trips = self._pending.setdefault(subscription.chat_id, (subscription.language, []))
+                if len(trips) < self._max_trips and all(t.id != trip.id for t in trips):
+                    trips.append(trip)
+                matched += 1
+        if matched:
+            self._wakeup.set()
+        return matched
+
+    def _add(self, subscription: Subscription) -> None:
+        self._subscriptions[subscription.id] = subscription
+        for offset in range((subscription.last_date - subscription.first_date).days + 1):
+            key = (subscription.from_city, subscription.to_city, subscription.first_date + timedelta(days=offset))
+            self._index.setdefault(key, {})[subscription.id] = subscription
+
+    def _remove(self, subscription: Subscription) -> None:
+        self._subscriptions.pop(subscription.id, None)
+        for offset in range((subscription.last_date - subscription.first_date).days + 1):
+            key = (subscription.from_city, subscription.to_city, subscription.first_date + timedelta(days=offset))
+            bucket = self._index.get(key)
+            if bucket is not None:
+                bucket.pop(subscription.id, None)
+                if not bucket:
+                    del self._index[key]
+
+    async def _refresh(self) -> None:
+        # Overlapping by a whole interval covers clock skew between processes and
+        # rows committed a little after their created_at; _add is idempotent.
+        loaded_at = datetime.utcnow()
+        since = self._loaded_at and self._loaded_at - timedelta(seconds=self._refresh_interval)
+        for subscription in await self._storage.list_subscriptions(date.today(), created_after=since):
+            if subscription.id not in self._subscriptions:
+                self._add(subscription)
+        self._loaded_at = loaded_at
+        self._next_refresh = time.monotonic() + self._refresh_interval
+
+    async def _expire(self) -> None:
+        today = date.today()
+        if self._expired_on == today:
+            return
+        self._expired_on = today
+        for subscription in [s for s in self._subscriptions.values() if s.last_date < today]:
+            self._remove(subscription)
+        try:
+            await self._storage.expire_subscriptions(today)
+        except Exception:
+            logger.exception('Failed to delete expired subscriptions')
+
+    def _take_batch(self) -> List[Tuple[int, str, List[Trip]]]:
+        batch = []
+        for chat_id in list(self._pending)[:self._batch_size]:
+            language, trips = self._pending.pop(chat_id)
+            batch.append((chat_id, language, trips))
+        return batch
+
+    async def _notify(self, batch: List[Tuple[int, str, List[Trip]]]) -> None:
+        results = await asyncio.gather(
+            *(self._handler(chat_id, language, trips) for chat_id, language, trips in batch),
+            return_exceptions=True,
+        )
+        for (chat_id, _, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error('Notifying chat %s about new trips failed: %r', chat_id, result)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            timeout = max(self._next_refresh - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._expire()
+            if time.monotonic() >= self._next_refresh:
+                try:
+                    await self._refresh()
+                except Exception:
+                    self._next_refresh = time.monotonic() + self._refresh_interval
+                    logger.exception('Failed to load new subscriptions')
+            if not self._pending:
+                continue
+            # Give trips published in the same moment a chance to share a message.
+            await asyncio.sleep(self._delay)
+            while self._pending and not self._stopping:
+                await self._notify(self._take_batch())
@@ -0,0 +1,123 @@
+"""Per-update accounting of SQL round trips.
+
+:func:`instrument_engine` hooks the engine's cursor and connect events, and
+:class:`QueryTraceMiddleware` gives every update its own :class:`QueryTrace`
+through a context variable. When the update is done one log line reports its
+statements, sessions and time spent in the database; updates over
+``query_budget`` statements are logged as warnings.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryTrace:
+    statements: int = 0
+    sessions: int = 0
+    db_seconds: float = 0.0
+    handlers: List[str] = field(default_factory=list)
+
+
+_trace: ContextVar[Optional[QueryTrace]] = ContextVar('query_trace', default=None)
+
+
+def _connect(conn: Any) -> None:
+    trace = _trace.get()
+    if trace:
+        trace.sessions += 1
+
+
+def _before_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    if _trace.get():
+        context._trace_start = time.perf_counter()
+
+
+def _after_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+    trace = _trace.get()
+    start = getattr(context, '_trace_start', None)
+    if trace and start is not None:
+        trace.statements += 1
+        trace.db_seconds += time.perf_counter() - start
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Count statements, connections and cursor time of ``engine`` into the current trace."""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, 'engine_connect', _connect):
+        return
+    event.listen(sync_engine, 'engine_connect', _connect)
+    event.listen(sync_engine, 'before_cursor_execute', _before_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_execute)
+
+
+class QueryTraceMiddleware(BaseMiddleware):
+    """Outer update middleware that traces the SQL issued while handling an update.
+
+    Must run ahead of the FSM middlewares so their queries are counted too.
+    """
+
+    def __init__(self, query_budget: int) -> None:
+        self.query_budget = query_budget
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = QueryTrace()
+        token = _trace.set(trace)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            _trace.reset(token)
+            self._log(event, trace, time.perf_counter() - start)
+
+    def _log(self, event: TelegramObject, trace: QueryTrace, seconds: float) -> None:
+        over_budget = trace.statements > self.query_budget
+        update_id = event.update_id if isinstance(event, Update) else None
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            'update_id=%s type=%s handler=%s statements=%d sessions=%d db_ms=%.2f total_ms=%.2f%s',
+            update_id, update_type, ','.join(trace.handlers) or '-', trace.statements, trace.sessions,
+            trace.db_seconds * 1000, seconds * 1000,
+            f' over_budget={self.query_budget}' if over_budget else '',
+            extra={
+                'update_id': update_id,
+                'update_type': update_type,
+                'handlers': trace.handlers,
+                'statements': trace.statements,
+                'sessions': trace.sessions,
+                'db_ms': trace.db_seconds * 1000,
+                'total_ms': seconds * 1000,
+            },
+        )
+
+
+class TraceHandlerMiddleware(BaseMiddleware):
+    """Inner middleware that records which handler an update reached in its trace."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = _trace.get()
+        if trace:
+            trace.handlers.append(f"{data['event_router'].name}.{data['handler'].callback.__name__}")
+        return await handler(event, data)
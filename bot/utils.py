@@ -1,4 +1,3 @@
-import asyncio
 import re
 from typing import Iterable
 
@@ -17,12 +16,19 @@ def validate_time(t: str) -> bool:
     return bool(TIME_REGEX.match(t))
 
 
+def route_text(from_city: str, to_city: str, stops: Iterable[str] = ()) -> str:
+    return " ➡️ ".join((from_city, *stops, to_city))
+
+
 def build_keyboard(buttons: Iterable[tuple[str, str]]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=data)] for text, data in buttons]
     )
 
 
-async def schedule_followup(bot, chat_id: int, text: str, delay: int, keyboard: InlineKeyboardMarkup | None = None):
-    await asyncio.sleep(delay)
-    await bot.send_message(chat_id, text, reply_markup=keyboard)
+def build_grid(rows: Iterable[Iterable[tuple[str, str]]]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=text, callback_data=data) for text, data in row] for row in rows if row
+        ]
+    )